@@ -16,6 +16,17 @@
 #
 
 from .total_potential import *
+from .utils.trajectory import TrajectorySink, MemorySink, MemmapSink, ChunkedFileSink, CallbackSink
+from .utils.conversion import kelvin_to_beta
+from .utils.random_blocks import RandomBlocks
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import json
+import os
+
+# Worker processes are started with "spawn": a forked child of a process that already ran a
+# multithreaded OpenMP kernel deadlocks in the OpenMP runtime.
+_process_context = multiprocessing.get_context("spawn")
 
 class SystemConfiguration(object):
     r"""
@@ -55,7 +66,36 @@ class SystemConfiguration(object):
         Dafault = None --> Optimal cutoff is calculated automatically
     neighbouring : bool
         True: Use neighbouring list for calculation of shortrange energies.
-        False: Calculate neighbouring with fast_distances function in cython.
+        False: Evaluate all pairs with the kernel selected by shortrange_kernel.
+    neighbouring_method : str
+        Neighbour-list used if neighbouring is True.
+        "cells": cell lists, rebuilt for every energy calculation.
+        "verlet": Verlet lists with a skin, only rebuilt if a particle moved further than skin/2.
+        "kdtree": periodic KD-tree, balanced for inhomogeneous systems.
+        Default = "cells"
+    skin : float
+        Skin distance of the Verlet lists.
+        Default = 1.0
+    longrange_method : str
+        "ewald": Classic Ewald summation over k-vectors, O(N^(3/2)).
+        "spme": Smooth Particle Mesh Ewald with FFTs, O(N log N).
+        Default = "ewald"
+    phase_tables : bool
+        Calculate the structure factor of the "ewald" method with the compiled kernel
+        from per-axis tables of phase factors. False: evaluate exp(i k r) with numpy.
+        Default = True
+    shortrange_kernel : str
+        Kernel for the shortrange energy if neighbouring is False.
+        "cython": compiled loop over all pairs without storing distances.
+        "numpy": vectorized evaluation of the pair distances, streamed in blocks of rows.
+        Default = "cython"
+    num_threads : int
+        Number of OpenMP threads for the compiled shortrange and distance kernels.
+        Default = None --> Read from the environment variable PARTICLESIM_NUM_THREADS, 1 if not set
+    block_size : int
+        Number of rows of the pair distances evaluated at once by the "numpy" shortrange kernel.
+        The peak memory is O(block_size * n) instead of O(n^2).
+        Default = None --> About 2^20 pairs per block
 
 
     Notes
@@ -65,10 +105,17 @@ class SystemConfiguration(object):
         Lorentz Berthelot Rule
         lj_cutoff = 2.5 * sigma
 
+        Particles with equal sigma and epsilon share a Lennard-Jones type. The mixed parameters
+        are stored as T x T tables for T types together with the type id of every particle,
+        lj_type_ids, so the memory is O(N + T^2). The dense N x N matrices lj_sigma_matrix,
+        lj_epsilon_matrix and lj_cutoff_matrix are only built on request.
+
     """
 
     def __init__(self, xyz, sigmas= 1.0, epsilons = 1.0, charges=0.0, box_size=12.0, epsilon_r=1.0, labels = [],
-                    p_error=10, r_cutoff = None, k_cutoff = None, neighbouring = False):
+                    p_error=10, r_cutoff = None, k_cutoff = None, neighbouring = False, longrange_method = "ewald",
+                    shortrange_kernel = "cython", num_threads = None, neighbouring_method = "cells", skin = 1.0,
+                    block_size = None, phase_tables = True):
 
         if not np.all((xyz>=0)*(xyz<box_size)):
             raise ValueError("xyz must be in range of zero to %d" %box_size)
@@ -102,15 +149,22 @@ class SystemConfiguration(object):
         self._create_lj_mean_parameters()
         self._create_lennard_jones_cutoff()
         self._neighbouring = neighbouring
+        self.neighbouring_method = neighbouring_method
+        self.skin = skin
+        self.longrange_method = longrange_method
+        self.phase_tables = phase_tables
+        self.shortrange_kernel = shortrange_kernel
+        self.num_threads = num_threads
+        self.block_size = block_size
         self.p_error = p_error
         self._total_potential = TotalPotential(self)
 
-        if self.box_size <= 2 * max(self.lj_cutoff_matrix.max(),self._total_potential.r_cutoff):
+        if self.box_size <= 2 * max(self.lj_cutoff_table.max(),self._total_potential.r_cutoff):
             raise ValueError('Box_size to small. Box_size has to be twice the cutoff radius '
                              'of the Lennard Jones potential.\n'
                              'box_size = %f\n lj_max = %f, coulomb_cutoff(r_cutoff) = %f \n'
                              'set box_size to be larger than %f \n '
-                             % (self.box_size, self.lj_cutoff_matrix.max(), self._total_potential.r_cutoff, 2 * max(self.lj_cutoff_matrix.max(),self._total_potential.r_cutoff))
+                             % (self.box_size, self.lj_cutoff_table.max(), self._total_potential.r_cutoff, 2 * max(self.lj_cutoff_table.max(),self._total_potential.r_cutoff))
                              )
 
 
@@ -124,6 +178,94 @@ class SystemConfiguration(object):
             raise ValueError('p_error must be bigger than zero')
         self._p_error = value
 
+    @property
+    def longrange_method(self):
+        return self._longrange_method
+
+    @longrange_method.setter
+    def longrange_method(self, value):
+        if value not in ("ewald", "spme"):
+            raise ValueError('longrange_method must be "ewald" or "spme"')
+        self._longrange_method = value
+
+    @property
+    def phase_tables(self):
+        return self._phase_tables
+
+    @phase_tables.setter
+    def phase_tables(self, value):
+        if not isinstance(value, bool):
+            raise TypeError('phase_tables must be a boolean')
+        if hasattr(self, '_total_potential'):
+            self._total_potential.longrange.phase_tables = value
+        self._phase_tables = value
+
+    @property
+    def shortrange_kernel(self):
+        return self._shortrange_kernel
+
+    @shortrange_kernel.setter
+    def shortrange_kernel(self, value):
+        if value not in ("cython", "numpy"):
+            raise ValueError('shortrange_kernel must be "cython" or "numpy"')
+        if hasattr(self, '_total_potential'):
+            self._total_potential.shortrange.kernel = value
+        self._shortrange_kernel = value
+
+    @property
+    def num_threads(self):
+        return self._num_threads
+
+    @num_threads.setter
+    def num_threads(self, value):
+        if value is None:
+            value = os.environ.get('PARTICLESIM_NUM_THREADS', 1)
+        try:
+            value = int(value)
+        except ValueError:
+            raise TypeError('num_threads must be an integer')
+        if value < 1:
+            raise ValueError('num_threads must be a positive integer')
+        if hasattr(self, '_total_potential'):
+            self._total_potential.shortrange.num_threads = value
+        self._num_threads = value
+
+    @property
+    def block_size(self):
+        return self._block_size
+
+    @block_size.setter
+    def block_size(self, value):
+        if value is not None and (not isinstance(value, (int, np.integer)) or value < 1):
+            raise ValueError('block_size must be a positive integer or None')
+        if hasattr(self, '_total_potential'):
+            self._total_potential.shortrange.block_size = value
+        self._block_size = value
+
+    @property
+    def neighbouring_method(self):
+        return self._neighbouring_method
+
+    @neighbouring_method.setter
+    def neighbouring_method(self, value):
+        if value not in ("cells", "verlet", "kdtree"):
+            raise ValueError('neighbouring_method must be "cells", "verlet" or "kdtree"')
+        self._neighbouring_method = value
+        if hasattr(self, '_total_potential'):
+            self._total_potential.shortrange.recreate_neighbourlist()
+
+    @property
+    def skin(self):
+        return self._skin
+
+    @skin.setter
+    def skin(self, value):
+        if not isinstance(value, (float, int)) or value < 0:
+            raise ValueError('skin must be a non-negative number')
+        self._skin = float(value)
+        if hasattr(self, '_total_potential'):
+            self._total_potential.shortrange.recreate_neighbourlist()
+
     @property
     def neighbouring(self):
         return self._neighbouring
@@ -209,18 +351,164 @@ class SystemConfiguration(object):
 
         return self._total_potential.potential(xyz_trial, lennard_jones, coulomb)
 
+    def potential_batch(self, xyz_stack, lennard_jones=True, coulomb=True, chunk_size=16):
+        r"""
+        Calculates the potential of many configurations at once, e.g. to rescore a trajectory.
+
+        Parameters
+        ----------
+        xyz_stack : ndarray(b,n,3), float
+            Positions of n particles for b configurations; may be a memory-mapped array.
+        lennard_jones : bool
+            If true calculate lennard jones potential.
+        coulomb : bool
+            If true calculate coulomb potential.
+        chunk_size : int
+            Number of configurations evaluated at once, bounds the memory.
+            Default = 16
+
+        Returns
+        -------
+        ndarray(b), float
+            Potential of every configuration.
+        """
+        if not (type(lennard_jones) == bool and type(coulomb) == bool):
+            raise TypeError('lennard_jones and coulomb must be booleans')
+        if not isinstance(chunk_size, (int, np.integer)) or chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer')
+        if np.ndim(xyz_stack) != 3 or np.shape(xyz_stack)[1:] != self.xyz.shape:
+            raise ValueError("xyz_stack must be of shape=(n_configurations, n_particles, 3)")
+
+        return self._total_potential.potential_batch(xyz_stack, lennard_jones, coulomb, chunk_size)
+
+    def init_incremental(self, xyz):
+        r"""
+        Stores xyz as accepted configuration for following single particle moves.
+
+        Parameters
+        ----------
+        xyz : ndarray(n,3), float
+            Position of n particles in x,y,z coordinates.
+        """
+        self._total_potential.init_incremental(np.asarray(xyz, dtype=float))
+
+    def delta_potential(self, xyz, index, new_position, lennard_jones, coulomb):
+        r"""
+        Calculates the change of the potential if the particle index of the accepted
+        configuration xyz is moved to new_position.
+
+        Parameters
+        ----------
+        xyz : ndarray(n,3), float
+            Accepted configuration, as passed to init_incremental.
+        index : int
+            Index of the moved particle.
+        new_position : ndarray(3), float
+            Trial position of the moved particle.
+        lennard_jones : bool
+            If true calculate lennard jones potential.
+        coulomb : bool
+            If true calculate coulomb potential.
+
+        Returns
+        -------
+        float
+            Difference of the potential between trial and accepted configuration.
+        """
+        if not (type(lennard_jones) == bool and type(coulomb) == bool):
+            raise TypeError('lennard_jones and coulomb must be booleans')
+        if not 0 <= index < len(xyz):
+            raise IndexError('particle index out of range')
+
+        return self._total_potential.delta_potential(xyz, index, np.asarray(new_position, dtype=float),
+                                                     lennard_jones, coulomb)
+
+    def commit(self, coulomb):
+        r"""
+        Accepts the trial move of the last delta_potential call.
+
+        Parameters
+        ----------
+        coulomb : bool
+            Has to match the value passed to delta_potential.
+        """
+        self._total_potential.commit(coulomb)
+
+    def rollback(self, coulomb):
+        r"""
+        Rejects the trial move of the last delta_potential call.
+
+        Parameters
+        ----------
+        coulomb : bool
+            Has to match the value passed to delta_potential.
+        """
+        self._total_potential.rollback(coulomb)
+
+    def get_incremental_state(self):
+        r"""
+        Returns the state of the accepted configuration of single particle moves, see
+        set_incremental_state.
+
+        Returns
+        -------
+        object
+            State of the potentials; it is only valid as long as the system configuration
+            is not changed.
+        """
+        return self._total_potential.get_incremental_state()
+
+    def set_incremental_state(self, state):
+        r"""
+        Switches single particle moves to an accepted configuration stored with
+        get_incremental_state, without recalculating it like init_incremental.
+
+        Parameters
+        ----------
+        state : object
+            State returned by get_incremental_state.
+        """
+        self._total_potential.set_incremental_state(state)
+
+    @property
+    def lj_sigma_matrix(self):
+        if self._lj_sigma_matrix is None:
+            self._lj_sigma_matrix = self._expand_lj_table(self.lj_sigma_table)
+        return self._lj_sigma_matrix
+
+    @property
+    def lj_epsilon_matrix(self):
+        if self._lj_epsilon_matrix is None:
+            self._lj_epsilon_matrix = self._expand_lj_table(self.lj_epsilon_table)
+        return self._lj_epsilon_matrix
+
+    @property
+    def lj_cutoff_matrix(self):
+        if self._lj_cutoff_matrix is None:
+            self._lj_cutoff_matrix = self._expand_lj_table(self.lj_cutoff_table)
+        return self._lj_cutoff_matrix
+
+    def _expand_lj_table(self, table):
+        return table[self.lj_type_ids[:, np.newaxis], self.lj_type_ids]
+
     def _create_lj_mean_parameters(self):
-        self._create_lennard_jones_epsilons()
-        self._create_lennard_jones_sigmas()
+        lj_types, lj_type_ids = np.unique(np.column_stack((self.sigmas, self.epsilons)), axis=0,
+                                          return_inverse=True)
+        self.lj_type_ids = np.asarray(lj_type_ids, dtype=np.int_).ravel()
+        self._create_lennard_jones_epsilons(lj_types[:, 1])
+        self._create_lennard_jones_sigmas(lj_types[:, 0])
+        self._lj_sigma_matrix = None
+        self._lj_epsilon_matrix = None
 
-    def _create_lennard_jones_epsilons(self):
-        self.lj_epsilon_matrix = np.sqrt(np.array([self.epsilons]).transpose()*np.array([self.epsilons]))
+    def _create_lennard_jones_epsilons(self, epsilons):
+        self.lj_epsilon_table = np.sqrt(np.array([epsilons]).transpose()*np.array([epsilons]))
 
-    def _create_lennard_jones_sigmas(self):
-        self.lj_sigma_matrix = (np.array([self.sigmas]).transpose() + np.array([self.sigmas]))/2
+    def _create_lennard_jones_sigmas(self, sigmas):
+        self.lj_sigma_table = (np.array([sigmas]).transpose() + np.array([sigmas]))/2
 
     def _create_lennard_jones_cutoff(self):
-        self.lj_cutoff_matrix = 2.5 * self.lj_sigma_matrix
+        self.lj_cutoff_table = 2.5 * self.lj_sigma_table
+        self._lj_cutoff_matrix = None
 
 
 class Sampler(object):
@@ -231,25 +519,199 @@ class Sampler(object):
     system_configuration : :obj:
         Instance of an SystemConfiguration Object that holds essential parameters
         previously set by the user.
+    lennard_jones : bool, optional, default=True
+        If true calculate lennard jones potential.
+    coulomb : bool, optional, default=True
+        If true calculate coulomb potential.
+    seed : None, int or numpy.random.SeedSequence, optional, default=None
+        Seed of the random numbers of the sampler. Every sampler owns its own stream;
+        run_chains and ReplicaExchangeSampler spawn independent child streams from it.
 
     """
-    def __init__(self, system_configuration, lennard_jones=True, coulomb=True):
+    def __init__(self, system_configuration, lennard_jones=True, coulomb=True, seed=None):
         if len(system_configuration.xyz) == 0:
             raise ValueError("no particle in system configuration")
         self.system_configuration = system_configuration
         self.lennard_jones = lennard_jones
         self.coulomb = coulomb
+        self.rng = RandomBlocks(seed)
 
+    # The update steps return the new configuration and potential, whether the move was
+    # accepted and the index of the moved particle (None if all particles were moved).
     def _update(self, xyz, pot, step, beta):
-        xyz_trial = (xyz + 2.0 * self.system_configuration.box_size * step
-                     * (np.random.rand(*xyz.shape)- 0.5))%self.system_configuration.box_size
+        # step is a float or one value per particle
+        xyz_trial = (xyz + 2.0 * self.system_configuration.box_size * np.reshape(step, (-1, 1))
+                     * (self.rng.random(xyz.shape)- 0.5))%self.system_configuration.box_size
         pot_trial = self.system_configuration.potential(xyz_trial, lennard_jones=self.lennard_jones, coulomb=self.coulomb)
-        if pot_trial <= pot or np.random.rand() < np.exp(beta * (pot - pot_trial)):
-            return xyz_trial, pot_trial
-        return xyz, pot
+        if pot_trial <= pot or self.rng.random() < np.exp(beta * (pot - pot_trial)):
+            return xyz_trial, pot_trial, True, None
+        return xyz, pot, False, None
+
+    def _update_single(self, xyz, pot, step, beta):
+        box_size = self.system_configuration.box_size
+        index = min(int(self.rng.random() * len(xyz)), len(xyz) - 1)
+        if not np.isscalar(step):
+            step = step[index]
+        new_position = (xyz[index] + 2.0 * box_size * step * (self.rng.random(3) - 0.5)) % box_size
+        delta = self.system_configuration.delta_potential(xyz, index, new_position,
+                                                          lennard_jones=self.lennard_jones, coulomb=self.coulomb)
+        if delta <= 0 or self.rng.random() < np.exp(-beta * delta):
+            self.system_configuration.commit(coulomb=self.coulomb)
+            xyz_trial = xyz.copy()
+            xyz_trial[index] = new_position
+            return xyz_trial, pot + delta, True, index
+        self.system_configuration.rollback(coulomb=self.coulomb)
+        return xyz, pot, False, index
 
+    def _get_update(self, move, xyz=None):
+        if move == "all":
+            return self._update
+        if move == "single":
+            self.system_configuration.init_incremental(self.system_configuration.xyz if xyz is None else xyz)
+            return self._update_single
+        raise ValueError('move has to be "all" or "single"')
 
-    def metropolis(self, iteration_number, step=0.1, beta=1.0):
+    def _check_step(self, step):
+        r"""
+        Returns step as float or, if there is one step per Lennard-Jones type, as array
+        with the step of every particle.
+        """
+        if isinstance(step, (float, int)):
+            if step <= 0:
+                raise ValueError("stepsize has to be a postive number")
+            return float(step)
+        step = np.asarray(step, dtype=np.float64)
+        if step.shape != (len(self.system_configuration.lj_sigma_table),) or not np.all(step > 0):
+            raise ValueError("stepsize has to be a postive number or one positive number per Lennard-Jones type")
+        return step[self.system_configuration.lj_type_ids]
+
+    def _run(self, update, iteration_number, step, beta, sink, stride, move="all", checkpoint_path=None,
+             checkpoint_interval=1000, start=None):
+        r"""
+        Performs the update steps and passes every stride-th configuration to the sink.
+        beta is either a float or an array with one value per step. start is a tuple
+        (xyz, pot, iteration, n_frames) to continue a run from a checkpoint after n_frames
+        stored frames.
+        """
+        if not isinstance(stride, int) or stride <= 0:
+            raise ValueError("stride has to be a positive integer")
+        if not isinstance(checkpoint_interval, int) or checkpoint_interval <= 0:
+            raise ValueError("checkpoint_interval has to be a positive integer")
+        if sink is None:
+            sink = MemorySink()
+        elif not isinstance(sink, TrajectorySink):
+            raise TypeError("sink has to be a TrajectorySink")
+
+        if start is None:
+            xyz = self.system_configuration.xyz
+            pot = self.system_configuration.potential(xyz, lennard_jones=self.lennard_jones, coulomb=self.coulomb)
+            first = 0
+            sink.open(iteration_number // stride + 1, len(xyz))
+            sink.append(xyz, pot)
+        else:
+            xyz, pot, first, n_frames = start
+            sink.open(iteration_number // stride + 1, len(xyz), start=n_frames)
+        constant_beta = isinstance(beta, (float, int))
+        # A schedule of beta is written once next to the checkpoint, a resumed run reads it from there
+        schedule_written = constant_beta or start is not None
+        for i in range(first, iteration_number):
+            xyz, pot = update(xyz, pot, step=step, beta=beta if constant_beta else beta[i])[:2]
+            if (i + 1) % stride == 0:
+                sink.append(xyz, pot)
+            if checkpoint_path is not None and (i + 1) % checkpoint_interval == 0 and i + 1 < iteration_number:
+                if not schedule_written:
+                    self._write_atomic(checkpoint_path + '.beta.npy', lambda file: np.save(file, beta))
+                    schedule_written = True
+                # The checkpoint records the frames of the sink, they have to be on disk before it
+                sink.flush()
+                self._write_checkpoint(checkpoint_path, xyz, pot, i + 1, (i + 1) // stride + 1, iteration_number,
+                                       step, beta if constant_beta else None, stride, move, checkpoint_interval)
+        return sink.close()
+
+    def _write_checkpoint(self, path, xyz, pot, iteration, n_frames, iteration_number, step, beta, stride, move,
+                          checkpoint_interval):
+        r"""
+        Writes the state of a run to a binary .npz file. n_frames is the number of frames
+        passed to the sink so far. beta is None for a schedule of beta, which is stored in
+        path + ".beta.npy" by _run.
+        """
+        state = dict(xyz=xyz, pot=pot, iteration=iteration, n_frames=n_frames, iteration_number=iteration_number,
+                     step=step, stride=stride, move=move, checkpoint_interval=checkpoint_interval,
+                     lennard_jones=self.lennard_jones, coulomb=self.coulomb,
+                     rng_state=json.dumps(self.rng.get_state()))
+        if beta is not None:
+            state['beta'] = beta
+        if move == "single":
+            # The structure factor is updated incrementally, a recalculated one differs by rounding errors
+            structure_factor = getattr(self.system_configuration._total_potential.longrange, '_structure_factor', None)
+            if structure_factor is not None:
+                state['structure_factor'] = structure_factor
+        self._write_atomic(path, lambda file: np.savez(file, **state))
+
+    @staticmethod
+    def _write_atomic(path, write):
+        r"""
+        Calls write with a binary file, which is first written to path + ".tmp" and then
+        renamed, so path always holds a complete file.
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def resume(self, checkpoint_path, sink=None, checkpoint=True):
+        r"""
+        Continue a run of metropolis or metropolis_sa from a checkpoint. The sampler has
+        to use the same system configuration as the interrupted run. The continued run is
+        bit-for-bit identical to the uninterrupted one: for move="single" the checkpoint holds
+        the incrementally updated Ewald structure factor. Only the neighbour lists of
+        neighbouring=True are rebuilt from the positions, which may change rounding errors.
+
+        Parameters
+        ----------
+        checkpoint_path : str
+            Path of the checkpoint.
+        sink : TrajectorySink, optional, default=None
+            Receives the configurations after the checkpoint. Default: MemorySink. A
+            MemmapSink or ChunkedFileSink with the files of the interrupted run keeps the
+            frames up to the checkpoint and appends the following ones.
+        checkpoint : bool, optional, default=True
+            If true keep on writing checkpoints to checkpoint_path.
+
+        Returns
+        -------
+        numpy.ndarray of float
+            Configuration trajectory, the return value of sink.close(). The MemorySink only
+            holds the configurations after the checkpoint.
+        numpy.ndarray of float
+            Total interaction and external potential trajectory.
+        """
+        with np.load(checkpoint_path) as data:
+            state = {key: data[key] for key in data.files}
+        self.lennard_jones = bool(state['lennard_jones'])
+        self.coulomb = bool(state['coulomb'])
+        step = float(state['step']) if state['step'].ndim == 0 else state['step']
+        if 'beta' in state:
+            beta = float(state['beta'])
+        else:
+            beta = np.load(checkpoint_path + '.beta.npy')
+        move = str(state['move'])
+        xyz = state['xyz']
+        iteration = int(state['iteration'])
+
+        update = self._get_update(move, xyz)
+        if 'structure_factor' in state:
+            self.system_configuration._total_potential.longrange._structure_factor = state['structure_factor']
+        self.rng.set_state(json.loads(str(state['rng_state'])))
+        return self._run(update, int(state['iteration_number']), step, beta, sink, int(state['stride']), move=move,
+                         checkpoint_path=checkpoint_path if checkpoint else None,
+                         checkpoint_interval=int(state['checkpoint_interval']),
+                         start=(xyz, float(state['pot']), iteration, int(state['n_frames'])))
+
+    def metropolis(self, iteration_number, step=0.1, beta=1.0, move="all", sink=None, stride=1,
+                   checkpoint_path=None, checkpoint_interval=1000):
         r"""
         Perform a Metropolis MC sampling procedure.
 
@@ -260,10 +722,26 @@ class Sampler(object):
             a function to compute potential energies.
         iteration_number : int
             Number of Metropolis update steps.
-        step : float, optional, default=0.1
-            Maximal size of an update move in each coordinate.
+        step : float or array-like of float, optional, default=0.1
+            Maximal size of an update move in each coordinate, as fraction of the box size.
+            One value per Lennard-Jones type (see SystemConfiguration.lj_type_ids) moves
+            every particle with the step of its type, e.g. the result of tune_step.
         beta : float, optional, default=1.0
             Inverse temperature factor (1/kT).
+        move : str, optional, default="all"
+            "all": move all particles in every step.
+            "single": move one randomly chosen particle in every step and only compute
+            the energy difference caused by this particle.
+        sink : TrajectorySink, optional, default=None
+            Receives the stored configurations, e.g. MemmapSink or ChunkedFileSink to write
+            them to disk. Default: MemorySink.
+        stride : int, optional, default=1
+            Only every stride-th configuration is passed to the sink.
+        checkpoint_path : str, optional, default=None
+            If given, the state of the run is written to this file every checkpoint_interval
+            steps; continue an interrupted run with resume.
+        checkpoint_interval : int, optional, default=1000
+            Number of steps between two checkpoints.
 
         Returns
         -------
@@ -271,34 +749,25 @@ class Sampler(object):
             Configuration trajectory.
         numpy.ndarray of float
             Total interaction and external potential trajectory.
+            Both are the return value of sink.close(), see the TrajectorySink in use.
 
         """
         # check input data
         if not isinstance(iteration_number,int) or iteration_number <= 0:
             raise ValueError("To sample you need at least one iteration step...\n"
                              "iteration_numer has to be a positive integer")
-        if not isinstance(step,(float,int)) or step <= 0:
-            raise ValueError("stepsize has to be a postive number")
+        step = self._check_step(step)
         if not isinstance(beta,(float,int)) or beta <= 0:
             raise ValueError("beta has to be a postive number")
 
-        # create copy of instance and work with copy, so initial configuration is unchanged
-        xyz_traj = [self.system_configuration.xyz]
-        pot_traj = [self.system_configuration.potential(self.system_configuration.xyz, lennard_jones=self.lennard_jones,
-                                                        coulomb=self.coulomb)]
+        update = self._get_update(move)
 
-        # perform metropolis
-        for i in range(iteration_number):
-            xyz, pot = self._update(
-                xyz_traj[-1]
-                , pot_traj[-1],
-                step=step, beta=beta)
-            xyz_traj.append(xyz)
-            pot_traj.append(pot)
-        return np.asarray(xyz_traj, dtype=np.float64), np.asarray(pot_traj, dtype=np.float64)
+        return self._run(update, iteration_number, step, beta, sink, stride, move=move,
+                         checkpoint_path=checkpoint_path, checkpoint_interval=checkpoint_interval)
 
 
-    def metropolis_sa(self, iteration_number, step=0.1, beta=1.0):
+    def metropolis_sa(self, iteration_number, step=0.1, beta=1.0, move="all", sink=None, stride=1,
+                      checkpoint_path=None, checkpoint_interval=1000):
         r"""
         Perform a Metropolis-based simulated annealing procedure.
 
@@ -313,6 +782,19 @@ class Sampler(object):
             Maximal size of an update move in each coordinate.
         beta : float, optional, default=1.0
             Initial inverse temperature factor (1/kT).
+        move : str, optional, default="all"
+            "all": move all particles in every step.
+            "single": move one randomly chosen particle in every step.
+        sink : TrajectorySink, optional, default=None
+            Receives the stored configurations. Default: MemorySink.
+        stride : int, optional, default=1
+            Only every stride-th configuration is passed to the sink.
+        checkpoint_path : str, optional, default=None
+            If given, the state of the run is written to this file every checkpoint_interval
+            steps; continue an interrupted run with resume. The schedule of beta is written
+            once to checkpoint_path + ".beta.npy".
+        checkpoint_interval : int, optional, default=1000
+            Number of steps between two checkpoints.
 
         Returns
         -------
@@ -320,6 +802,7 @@ class Sampler(object):
             Configuration trajectory.
         numpy.ndarray of float
             Total interaction and external potential trajectory.
+            Both are the return value of sink.close(), see the TrajectorySink in use.
 
         """
         if isinstance(beta, (float, int)):
@@ -340,16 +823,459 @@ class Sampler(object):
                 print("beta must be float|int, touple with len 2 or touple with len equal to iteration number")
                 exit(1)
 
-        xyz_traj = [self.system_configuration.xyz]
-        pot_traj = [self.system_configuration.potential(self.system_configuration.xyz, lennard_jones=self.lennard_jones,
-                                                        coulomb=self.coulomb)]
+        step = self._check_step(step)
+        update = self._get_update(move)
+
+        return self._run(update, iteration_number, step, beta_values, sink, stride, move=move,
+                         checkpoint_path=checkpoint_path, checkpoint_interval=checkpoint_interval)
+
+    def tune_step(self, iteration_number, step=0.1, beta=1.0, move="all", target_acceptance=0.5, interval=100,
+                  per_type=False):
+        r"""
+        Equilibrate the system configuration and adjust the step size toward a target
+        acceptance ratio. After every interval steps the step is multiplied by the ratio
+        of the measured and the target acceptance, limited to [0.5, 2]. The tuned step is
+        meant to be kept fixed in the following production run; the equilibrated
+        configuration is stored in system_configuration.xyz.
+
+        Parameters
+        ----------
+        iteration_number : int
+            Number of Metropolis update steps of the equilibration.
+        step : float, optional, default=0.1
+            Initial size of an update move in each coordinate, as fraction of the box size.
+        beta : float, optional, default=1.0
+            Inverse temperature factor (1/kT).
+        move : str, optional, default="all"
+            "all" or "single", see metropolis.
+        target_acceptance : float, optional, default=0.5
+            Wanted ratio of accepted moves.
+        interval : int, optional, default=100
+            Number of steps between two adjustments.
+        per_type : bool, optional, default=False
+            Tune one step for every Lennard-Jones type. Only possible with move="single",
+            where the acceptance of every move belongs to one particle.
+
+        Returns
+        -------
+        float or numpy.ndarray(shape=(n_types,))
+            Tuned step, can be passed to metropolis.
+        numpy.ndarray(shape=(n_intervals,)) or numpy.ndarray(shape=(n_intervals, n_types))
+            Acceptance ratio of every interval, nan for types without moves.
+        """
+        if not isinstance(iteration_number, int) or iteration_number <= 0:
+            raise ValueError("iteration_number has to be a positive integer")
+        if not isinstance(step, (float, int)) or step <= 0:
+            raise ValueError("stepsize has to be a postive number")
+        if not isinstance(beta, (float, int)) or beta <= 0:
+            raise ValueError("beta has to be a postive number")
+        if not 0 < target_acceptance < 1:
+            raise ValueError("target_acceptance has to be between zero and one")
+        if not isinstance(interval, int) or interval <= 0:
+            raise ValueError("interval has to be a positive integer")
+        if per_type and move != "single":
+            raise ValueError('per_type tuning is only possible with move="single"')
+
+        types = self.system_configuration.lj_type_ids
+        steps = np.full(len(self.system_configuration.lj_sigma_table) if per_type else 1, float(step))
+        update = self._get_update(move)
+        xyz = self.system_configuration.xyz
+        pot = self.system_configuration.potential(xyz, lennard_jones=self.lennard_jones, coulomb=self.coulomb)
+        acceptance_history = []
+
+        for start in range(0, iteration_number, interval):
+            attempted = np.zeros(len(steps))
+            accepted = np.zeros(len(steps))
+            particle_steps = steps[types] if per_type else steps[0]
+            for i in range(start, min(start + interval, iteration_number)):
+                xyz, pot, is_accepted, index = update(xyz, pot, step=particle_steps, beta=beta)
+                t = types[index] if per_type else 0
+                attempted[t] += 1
+                accepted[t] += is_accepted
+
+            with np.errstate(invalid='ignore'):
+                acceptance = accepted / attempted
+            acceptance_history.append(acceptance)
+            tried = attempted > 0
+            steps[tried] *= np.clip(acceptance[tried] / target_acceptance, 0.5, 2.0)
+            # a step of half the box already covers the whole box
+            steps = np.minimum(steps, 0.5)
+
+        self.system_configuration.xyz = xyz
+        acceptance_history = np.array(acceptance_history)
+        if per_type:
+            return steps, acceptance_history
+        return steps[0], acceptance_history[:, 0]
+
+    def metropolis_ensemble(self, n_chains, iteration_number, step=0.1, beta=1.0, stride=1, chunk_size=None):
+        r"""
+        Perform Metropolis MC sampling of several chains in lock-step. All particles of all
+        chains are moved at once, the trial energies are computed by one batched potential
+        call and accepted with a vectorized Metropolis test.
+        For small systems this saves the overhead of one potential call per chain and step.
+
+        Parameters
+        ----------
+        n_chains : int
+            Number of chains, all start from the current configuration.
+        iteration_number : int
+            Number of Metropolis update steps.
+        step : float or array-like of float, optional, default=0.1
+            Maximal size of an update move in each coordinate, see metropolis.
+        beta : float or array-like of float, optional, default=1.0
+            Inverse temperature factor (1/kT), a float or one value per chain.
+        stride : int, optional, default=1
+            Only every stride-th configuration is stored.
+        chunk_size : int, optional, default=None
+            Number of chains evaluated at once by potential_batch. Default: all chains.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(n_chains, n_frames, n, 3))
+            Configuration trajectories of all chains.
+        numpy.ndarray(shape=(n_chains, n_frames))
+            Potential trajectories of all chains.
+        """
+        if not isinstance(n_chains, int) or n_chains <= 0:
+            raise ValueError("n_chains has to be a positive integer")
+        if not isinstance(iteration_number, int) or iteration_number <= 0:
+            raise ValueError("iteration_number has to be a positive integer")
+        if not isinstance(stride, int) or stride <= 0:
+            raise ValueError("stride has to be a positive integer")
+        step = np.reshape(self._check_step(step), (-1, 1))
+        beta = np.asarray(beta, dtype=np.float64)
+        if beta.shape not in ((), (n_chains,)) or not np.all(beta > 0):
+            raise ValueError("beta has to be a postive number or one positive number per chain")
+        if chunk_size is None:
+            chunk_size = n_chains
+
+        box_size = self.system_configuration.box_size
+        xyz = np.repeat(self.system_configuration.xyz[np.newaxis], n_chains, axis=0)
+        pot = self.system_configuration.potential_batch(xyz, lennard_jones=self.lennard_jones, coulomb=self.coulomb,
+                                                        chunk_size=chunk_size)
+        xyz_traj = np.zeros((n_chains, iteration_number // stride + 1) + xyz.shape[1:])
+        pot_traj = np.zeros((n_chains, iteration_number // stride + 1))
+        xyz_traj[:, 0] = xyz
+        pot_traj[:, 0] = pot
+
+        # The input is validated once above, the steps call the total potential directly
+        potential_batch = self.system_configuration._total_potential.potential_batch
+        scale = 2.0 * box_size * step
+        with np.errstate(over='ignore'):
+            for i in range(iteration_number):
+                xyz_trial = self.rng.random(xyz.shape)
+                xyz_trial -= 0.5
+                xyz_trial *= scale
+                xyz_trial += xyz
+                np.mod(xyz_trial, box_size, out=xyz_trial)
+                pot_trial = potential_batch(xyz_trial, self.lennard_jones, self.coulomb, chunk_size)
+                accept = (pot_trial <= pot) | (self.rng.random(n_chains) < np.exp(beta * (pot - pot_trial)))
+                xyz[accept] = xyz_trial[accept]
+                pot[accept] = pot_trial[accept]
+                if (i + 1) % stride == 0:
+                    xyz_traj[:, (i + 1) // stride] = xyz
+                    pot_traj[:, (i + 1) // stride] = pot
+        return xyz_traj, pot_traj
+
+    def _spawn_seeds(self, seed, n):
+        r"""
+        Independent seed sequences for n child streams, spawned from seed or, if seed is
+        None, from the seed of the sampler.
+        """
+        if seed is None:
+            return self.rng.seed_sequence.spawn(n)
+        return np.random.SeedSequence(seed).spawn(n)
+
+    def run_chains(self, n_chains, iteration_number, step=0.1, beta=1.0, move="all", stride=1, seed=None,
+                   sinks=None, n_workers=None):
+        r"""
+        Run independent Metropolis chains from the current configuration in a pool of processes.
+        The system configuration is sent once to every worker process, not with every chain.
+        The workers are spawned, not forked, so a script has to call run_chains inside an
+        if __name__ == "__main__": block.
+
+        Parameters
+        ----------
+        n_chains : int
+            Number of chains.
+        iteration_number : int
+            Number of Metropolis update steps of every chain.
+        step : float, optional, default=0.1
+            Maximal size of an update move in each coordinate.
+        beta : float, optional, default=1.0
+            Inverse temperature factor (1/kT).
+        move : str, optional, default="all"
+            "all" or "single", see metropolis.
+        stride : int, optional, default=1
+            Only every stride-th configuration is stored.
+        seed : int, optional, default=None
+            Seed of the chains. Chain c always gets the same random numbers for the same seed,
+            independent of the number of workers. Default: child streams of the sampler's seed.
+        sinks : list of TrajectorySink, optional, default=None
+            One sink per chain, e.g. a MemmapSink or ChunkedFileSink with one file per chain.
+            The sinks are used in the worker processes.
+        n_workers : int, optional, default=None
+            Number of worker processes. Default: number of CPUs.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(n_chains, n_frames, n, 3))
+            Configuration trajectories of all chains.
+        numpy.ndarray(shape=(n_chains, n_frames))
+            Potential trajectories of all chains.
+            None if sinks are given, the trajectories are stored by the sinks.
+        """
+        if not isinstance(n_chains, int) or n_chains <= 0:
+            raise ValueError("n_chains has to be a positive integer")
+        if sinks is not None and len(sinks) != n_chains:
+            raise ValueError("sinks must contain one sink per chain")
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        if not isinstance(n_workers, int) or n_workers <= 0:
+            raise ValueError("n_workers has to be a positive integer")
+
+        seeds = self._spawn_seeds(seed, n_chains)
+        with ProcessPoolExecutor(max_workers=min(n_workers, n_chains), mp_context=_process_context,
+                                 initializer=_init_chain_worker,
+                                 initargs=(self.system_configuration, self.lennard_jones, self.coulomb)) as pool:
+            futures = [pool.submit(_run_chain, seeds[c], None if sinks is None else sinks[c], iteration_number,
+                                   step, beta, move, stride) for c in range(n_chains)]
+            results = [future.result() for future in futures]
+
+        if sinks is not None:
+            return None
+        return np.array([xyz for xyz, pot in results]), np.array([pot for xyz, pot in results])
 
-        for i in range(iteration_number):
-            xyz, pot = self._update(xyz_traj[-1], pot_traj[-1],
-                step=step, beta=beta_values[i])
-            xyz_traj.append(xyz)
-            pot_traj.append(pot)
 
-        return np.asarray(xyz_traj, dtype=np.float64), np.asarray(pot_traj, dtype=np.float64)
+# Sampler of a worker process of Sampler.run_chains, created once per process
+_chain_sampler = None
 
 
+def _init_chain_worker(system_configuration, lennard_jones, coulomb):
+    global _chain_sampler
+    _chain_sampler = Sampler(system_configuration, lennard_jones=lennard_jones, coulomb=coulomb)
+
+
+def _run_chain(seed_sequence, sink, iteration_number, step, beta, move, stride):
+    _chain_sampler.rng = RandomBlocks(seed_sequence)
+    result = _chain_sampler.metropolis(iteration_number, step=step, beta=beta, move=move, sink=sink, stride=stride)
+    if sink is not None:
+        return None
+    return result
+
+
+class ReplicaExchangeSampler(Sampler):
+    r"""Parallel tempering: replicas of the system configuration are sampled at a ladder
+    of temperatures in persistent worker processes and neighbouring temperatures are
+    swapped regularly. Only energies and betas are exchanged between the processes, the
+    coordinates stay in the workers until the end of the run. Trajectories are written
+    by the workers to one sink per temperature. The workers are spawned like the ones of
+    Sampler.run_chains.
+
+    Parameters
+    ----------
+    system_configuration : :obj:
+        Instance of an SystemConfiguration Object that holds essential parameters
+        previously set by the user.
+    temperatures : array-like of float
+        Temperature of every replica in Kelvin.
+    lennard_jones : bool, optional, default=True
+        If true calculate lennard jones potential.
+    coulomb : bool, optional, default=True
+        If true calculate coulomb potential.
+    seed : None, int or numpy.random.SeedSequence, optional, default=None
+        Seed of the sampler, see Sampler.
+
+    """
+    def __init__(self, system_configuration, temperatures, lennard_jones=True, coulomb=True, seed=None):
+        super(ReplicaExchangeSampler, self).__init__(system_configuration, lennard_jones=lennard_jones,
+                                                     coulomb=coulomb, seed=seed)
+        temperatures = np.sort(np.asarray(temperatures, dtype=np.float64))
+        if temperatures.ndim != 1 or len(temperatures) < 2 or not np.all(temperatures > 0):
+            raise ValueError("temperatures must contain at least two positive values")
+        self.temperatures = temperatures
+        self.betas = np.asarray(kelvin_to_beta(temperatures), dtype=np.float64)
+        self.swap_attempts = np.zeros(len(temperatures) - 1, dtype=int)
+        self.swap_accepted = np.zeros(len(temperatures) - 1, dtype=int)
+
+    def run(self, n_exchanges, exchange_interval=10, step=0.1, move="all", seed=None, n_workers=None, sinks=None,
+            stride=1):
+        r"""
+        Sample all replicas for n_exchanges * exchange_interval steps. After every
+        exchange_interval steps swaps of neighbouring temperatures are attempted,
+        alternating between the even and the odd pairs of the ladder.
+
+        Parameters
+        ----------
+        n_exchanges : int
+            Number of swap attempts.
+        exchange_interval : int, optional, default=10
+            Number of Metropolis steps between two swap attempts.
+        step : float, optional, default=0.1
+            Maximal size of an update move in each coordinate.
+        move : str, optional, default="all"
+            "all" or "single", see metropolis.
+        seed : int, optional, default=None
+            Seed of the replicas and the swaps. Default: child streams of the sampler's seed.
+        n_workers : int, optional, default=None
+            Number of worker processes, the replicas are distributed over them.
+            Default: min(number of replicas, number of CPUs).
+        sinks : list of TrajectorySink, optional, default=None
+            One sink per temperature, in the order of the sorted temperatures. The worker
+            that holds the replica at a temperature appends its frames, so the sinks have to
+            write to files, e.g. MemmapSink or ChunkedFileSink; the sink is reopened with
+            open(n_frames, n_particles, start) whenever the temperature changes its worker.
+            Default: no trajectories are stored.
+        stride : int, optional, default=1
+            Only every stride-th configuration is passed to the sinks.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(m, n, 3))
+            Final configuration at every temperature.
+        numpy.ndarray(shape=(n_exchanges + 1, m))
+            Potential at every temperature before the first and after every exchange step.
+        numpy.ndarray(shape=(m - 1,))
+            Swap acceptance rate of every pair of neighbouring temperatures.
+        """
+        if not isinstance(n_exchanges, int) or n_exchanges <= 0:
+            raise ValueError("n_exchanges has to be a positive integer")
+        if not isinstance(exchange_interval, int) or exchange_interval <= 0:
+            raise ValueError("exchange_interval has to be a positive integer")
+        step = self._check_step(step)
+        if move not in ("all", "single"):
+            raise ValueError('move has to be "all" or "single"')
+        n_replicas = len(self.betas)
+        if n_workers is None:
+            n_workers = min(n_replicas, os.cpu_count() or 1)
+        if not isinstance(n_workers, int) or n_workers <= 0:
+            raise ValueError("n_workers has to be a positive integer")
+        n_workers = min(n_workers, n_replicas)
+        if not isinstance(stride, int) or stride <= 0:
+            raise ValueError("stride has to be a positive integer")
+        if sinks is not None:
+            if len(sinks) != n_replicas:
+                raise ValueError("sinks must contain one sink per temperature")
+            if any(isinstance(sink, MemorySink) for sink in sinks):
+                raise ValueError("the sinks are written by the worker processes, a MemorySink would be lost")
+            sinks = list(sinks)
+        n_frames = n_exchanges * exchange_interval // stride + 1
+
+        seeds = self._spawn_seeds(seed, n_replicas + 1)
+        random_state = RandomBlocks(seeds[-1])
+        # replica_at[t] is the replica at temperature t
+        replica_at = np.arange(n_replicas)
+        self.swap_attempts[:] = 0
+        self.swap_accepted[:] = 0
+
+        workers = []
+        try:
+            for w in range(n_workers):
+                replicas = {r: seeds[r] for r in range(w, n_replicas, n_workers)}
+                connection, worker_connection = _process_context.Pipe()
+                process = _process_context.Process(target=_replica_worker, args=(
+                    worker_connection, self.system_configuration, self.lennard_jones, self.coulomb, move, replicas,
+                    sinks, stride, n_frames))
+                process.start()
+                workers.append((process, connection))
+
+            energies = self._replica_request(workers, ("energies",))
+            pot_traj = np.zeros((n_exchanges + 1, n_replicas))
+            pot_traj[0] = energies[replica_at]
+
+            for exchange in range(n_exchanges):
+                betas = np.empty(n_replicas)
+                betas[replica_at] = self.betas
+                temperature_of = np.empty(n_replicas, dtype=int)
+                temperature_of[replica_at] = np.arange(n_replicas)
+                energies = self._replica_request(workers, ("run", exchange_interval, step, betas, temperature_of,
+                                                           exchange * exchange_interval))
+
+                for t in range(exchange % 2, n_replicas - 1, 2):
+                    low, high = replica_at[t], replica_at[t + 1]
+                    self.swap_attempts[t] += 1
+                    log_acceptance = (self.betas[t] - self.betas[t + 1]) * (energies[low] - energies[high])
+                    if log_acceptance >= 0 or random_state.random() < np.exp(log_acceptance):
+                        replica_at[t], replica_at[t + 1] = high, low
+                        self.swap_accepted[t] += 1
+                pot_traj[exchange + 1] = energies[replica_at]
+
+            xyz = self._replica_request(workers, ("configurations",))[replica_at]
+        finally:
+            for process, connection in workers:
+                try:
+                    connection.send(("stop",))
+                except OSError:
+                    # The worker is dead, do not hide the exception that ends the run
+                    pass
+                process.join()
+
+        acceptance = self.swap_accepted / np.maximum(self.swap_attempts, 1)
+        return xyz, pot_traj, acceptance
+
+    def _replica_request(self, workers, message):
+        r"""
+        Sends a message to all workers and combines their answers, ordered by replica.
+        """
+        for process, connection in workers:
+            connection.send(message)
+        answers = {}
+        for process, connection in workers:
+            answer = connection.recv()
+            if isinstance(answer, Exception):
+                raise answer
+            answers.update(answer)
+        return np.array([answers[r] for r in range(len(answers))])
+
+
+def _replica_worker(connection, system_configuration, lennard_jones, coulomb, move, replicas, sinks=None, stride=1,
+                    n_frames=1):
+    r"""
+    Worker process of ReplicaExchangeSampler.run, holds the state of some replicas and
+    writes their frames to the sink of their current temperature.
+    """
+    sampler = Sampler(system_configuration, lennard_jones=lennard_jones, coulomb=coulomb)
+    update = sampler._get_update(move)
+    xyz = {r: system_configuration.xyz for r in replicas}
+    pot = {r: system_configuration.potential(system_configuration.xyz, lennard_jones=lennard_jones,
+                                             coulomb=coulomb) for r in replicas}
+    random_states = {r: RandomBlocks(seed_sequence) for r, seed_sequence in replicas.items()}
+    # Incremental state of single particle moves of every replica, built once
+    incremental_states = {}
+
+    while True:
+        message = connection.recv()
+        try:
+            if message[0] == "stop":
+                break
+            elif message[0] == "energies":
+                connection.send(pot)
+            elif message[0] == "configurations":
+                connection.send(xyz)
+            elif message[0] == "run":
+                n_steps, step, betas, temperature_of, first_step = message[1:]
+                for r in replicas:
+                    sampler.rng = random_states[r]
+                    if move == "single":
+                        if r in incremental_states:
+                            system_configuration.set_incremental_state(incremental_states[r])
+                        else:
+                            system_configuration.init_incremental(xyz[r])
+                    sink = None if sinks is None else sinks[temperature_of[r]]
+                    if sink is not None:
+                        # The frames before first_step were written by the worker that held the temperature
+                        sink.open(n_frames, len(xyz[r]), start=first_step // stride + 1 if first_step else 0)
+                        if first_step == 0:
+                            sink.append(xyz[r], pot[r])
+                    for i in range(first_step, first_step + n_steps):
+                        xyz[r], pot[r] = update(xyz[r], pot[r], step=step, beta=betas[r])[:2]
+                        if sink is not None and (i + 1) % stride == 0:
+                            sink.append(xyz[r], pot[r])
+                    if sink is not None:
+                        sink.close()
+                    if move == "single":
+                        incremental_states[r] = system_configuration.get_incremental_state()
+                connection.send(pot)
+        except Exception as exception:
+            connection.send(exception)
+    connection.close()
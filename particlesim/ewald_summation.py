@@ -17,7 +17,7 @@
 
 import numpy as np
 from particlesim.utils.conversion import prefactor
-from .k_cython import calc_k_vectors
+from .k_cython import calc_k_vectors, calc_k_vectors_half, structure_factor_tables, structure_factor_batch
 
 
 class EwaldSummation(object):
@@ -30,19 +30,30 @@ class EwaldSummation(object):
         Standard deviation of Gaussian charge distribution.
     k_cutoff : float
         Cutoff-radius in reciprocal space.
+    half_space : bool, optional, default=True
+        Only use one k-vector of every pair k, -k and weight it twice.
+        False: use the full sphere of k-vectors.
+    phase_tables : bool, optional, default=True
+        Calculate the structure factor from per-axis tables of phase factors, which
+        are built by complex multiplications instead of evaluating exp(i k r) for every
+        k-vector and particle.
+        False: evaluate exp(i k r) directly with numpy.
 
     """
-    def __init__(self, system_conf, sigma, k_cutoff):
+    def __init__(self, system_conf, sigma, k_cutoff, half_space=True, phase_tables=True):
         self.system_conf = system_conf
         self.positions = system_conf.xyz # Original Positions
         self.charges = system_conf.charges
         self.volume = system_conf.volume
-        self.sigma = sigma
-        self.sigma_sq = sigma * sigma
+        self.half_space = half_space
+        self.phase_tables = phase_tables
+        self._structure_factor = None
+        self._trial_structure_factor = None
 
         # Assig cutoff k and calculate vectors in k-space for longrange interaction energy
         self._k_cutoff = k_cutoff # multiple of 2*pi/L
-        self.k_vectors = np.multiply(calc_k_vectors(self._k_cutoff), 2*np.pi/system_conf.box_size)
+        self.k_vectors = self._calc_k_vectors()
+        self.sigma = sigma
 
     @property
     def k_cutoff(self):
@@ -51,7 +62,47 @@ class EwaldSummation(object):
     @k_cutoff.setter
     def k_cutoff(self, value):
         self._k_cutoff = value
-        self.k_vectors = np.multiply(calc_k_vectors(self._k_cutoff), 2*np.pi/self.system_conf.box_size)
+        self.k_vectors = self._calc_k_vectors()
+        self._update_constants()
+
+    def _calc_k_vectors(self):
+        if self.half_space:
+            k_vectors = calc_k_vectors_half(self._k_cutoff)
+        else:
+            k_vectors = calc_k_vectors(self._k_cutoff)
+        # integer k-vectors in multiples of 2*pi/L for the phase tables
+        self._k_integers = np.asarray(k_vectors, dtype=np.int_).reshape(-1, 3)
+        # k-vectors grouped by their first two components for structure_factor_batch
+        self._k_pairs, pair_index = np.unique(self._k_integers[:, :2], axis=0, return_inverse=True)
+        self._k_pair_index = np.ascontiguousarray(pair_index.ravel(), dtype=np.int_)
+        self._k_z = np.ascontiguousarray(self._k_integers[:, 2])
+        return np.multiply(k_vectors, 2*np.pi/self.system_conf.box_size)
+
+    @property
+    def sigma(self):
+        return self._sigma
+
+    @sigma.setter
+    def sigma(self, value):
+        self._sigma = value
+        self.sigma_sq = value * value
+        self._update_constants()
+
+    def _update_constants(self):
+        r"""
+        Calculates all terms of the Ewald summation that do not depend on the particle positions.
+        Called whenever k_cutoff or sigma change.
+        """
+        self._k_sq = np.einsum('ij,ij -> i', self.k_vectors, self.k_vectors)
+        self._k_weights = np.exp(-self.sigma_sq * self._k_sq / 2) / self._k_sq * prefactor / (2 * self.volume)
+        if self.half_space:
+            # |S(-k)|^2 = |S(k)|^2
+            self._k_weights *= 2
+        self._self_interaction_potential = np.dot(self.charges.T, self.charges) * \
+                                           1 / (np.sqrt(2*np.pi) * self.sigma) * 1/( 4 * np.pi) * prefactor
+        # A cached structure factor belongs to the old k-vectors
+        self._structure_factor = None
+        self._trial_structure_factor = None
 
     def longrange_energy(self, positions):
         r"""
@@ -74,25 +125,156 @@ class EwaldSummation(object):
         self.positions  = positions
 
         # Calculate longrange potential vecotrized
+        longrange_potential = self._reciprocal_energy(self._calc_structure_factor(self.positions, self.charges))
 
-        k_sq = np.einsum('ij,ij -> i', self.k_vectors, self.k_vectors)
+        # Calculate total potential
+        longrange_and_self_potential = longrange_potential - self._self_interaction_potential
 
-        structure_factor = np.einsum('ik, k', np.exp(1j * np.einsum('ji, ki', self.k_vectors, self.positions)), self.charges )
-        structure_factor_squared = structure_factor.real**2 + structure_factor.imag**2
+        return longrange_and_self_potential
 
-        longrange_potential = np.dot(structure_factor_squared, np.exp(-self.sigma_sq * k_sq / 2) / k_sq) * \
-                              prefactor / (2 * self.volume )
+    def longrange_energy_batch(self, positions):
+        r"""
+        Calculates the longrange potential and the self interaction potential of
+        several particle distributions at once.
 
-        # Calculate self-interaction potential
+        Parameters
+        ----------
+        positions : array-like of floats, shape=(b, n, 3)
+            Positions of all particles inside the box for b configurations.
 
-        self_interaction_potential = np.dot(self.charges.T, self.charges) * \
-                                     1 / (np.sqrt(2*np.pi) * self.sigma) * 1/( 4 * np.pi) * prefactor
+        Returns
+        -------
+        numpy.ndarray(shape=(b,))
+            long-range and self-interaction potential of every configuration
 
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        if self.phase_tables:
+            structure_factors = structure_factor_batch(np.ascontiguousarray(positions),
+                                                       np.ascontiguousarray(self.charges, dtype=np.float64),
+                                                       self._k_pairs, self._k_pair_index, self._k_z,
+                                                       self.system_conf.box_size)
+        else:
+            structure_factors = np.exp(1j * np.einsum('kd, bnd -> bkn', self.k_vectors, positions)).dot(self.charges)
+        structure_factors_squared = structure_factors.real**2 + structure_factors.imag**2
 
-        # Calculate total potential
-        longrange_and_self_potential = longrange_potential - self_interaction_potential
+        return structure_factors_squared.dot(self._k_weights) - self._self_interaction_potential
 
-        return longrange_and_self_potential
+    def init_structure_factor(self, positions):
+        r"""
+        Calculates and stores the structure factor of a configuration. This starts the
+        stateful mode: following calls of delta_energy are relative to the stored configuration,
+        which is only changed by commit.
+
+        Parameters
+        ----------
+        positions : array-like of floats
+            Current position of all particles inside the box.
+
+        """
+        self.positions = positions
+        self._structure_factor = self._calc_structure_factor(positions, self.charges)
+        self._trial_structure_factor = None
+
+    def delta_energy(self, indices, old_positions, new_positions):
+        r"""
+        Calculates the change of the longrange energy if m particles are moved.
+        Only the contributions of the moved particles to the stored structure factor are
+        updated, so the costs are O(K*m) instead of O(K*N).
+
+        Parameters
+        ----------
+        indices : int or array-like of int
+            Indices of the moved particles.
+        old_positions : array-like of floats, shape=(m, 3) or (3,)
+            Positions of the particles in the stored configuration.
+        new_positions : array-like of floats, shape=(m, 3) or (3,)
+            Trial positions of the particles.
+
+        Returns
+        -------
+        float
+            Difference of the longrange energy between trial and stored configuration.
+
+        """
+        if self._structure_factor is None:
+            raise ValueError('structure factor is not initialized, call init_structure_factor first')
+
+        indices = np.atleast_1d(indices)
+        old_positions = np.reshape(old_positions, (len(indices), 3))
+        new_positions = np.reshape(new_positions, (len(indices), 3))
+        charges = self.charges[indices]
+
+        structure_factor = self._structure_factor + self._calc_structure_factor(new_positions, charges) - \
+                           self._calc_structure_factor(old_positions, charges)
+        self._trial_structure_factor = structure_factor
+
+        return self._reciprocal_energy(structure_factor) - self._reciprocal_energy(self._structure_factor)
+
+    def commit(self):
+        r"""
+        Accepts the trial move of the last delta_energy call and updates the stored structure factor.
+        """
+        if self._trial_structure_factor is None:
+            raise ValueError('no trial move to commit')
+        self._structure_factor = self._trial_structure_factor
+        self._trial_structure_factor = None
+
+    def rollback(self):
+        r"""
+        Rejects the trial move of the last delta_energy call. The stored structure factor is unchanged.
+        """
+        self._trial_structure_factor = None
+
+    def get_incremental_state(self):
+        r"""
+        Returns
+        -------
+        numpy.ndarray of complex
+            Stored structure factor, can be passed to set_incremental_state to switch back
+            to this configuration without recalculating it.
+        """
+        return self._structure_factor
+
+    def set_incremental_state(self, state):
+        r"""
+        Parameters
+        ----------
+        state : numpy.ndarray of complex
+            Structure factor returned by get_incremental_state.
+        """
+        self._structure_factor = state
+        self._trial_structure_factor = None
+
+    def _calc_structure_factor(self, positions, charges):
+        r"""
+        Calculates the structure factor S(k) = sum_j q_j exp(i k r_j) for all k-vectors.
+
+        Parameters
+        ----------
+        positions : array-like of floats, shape=(m, 3)
+            Positions of the particles.
+        charges : array-like of floats, shape=(m,)
+            Charges of the particles.
+
+        Returns
+        -------
+        numpy.ndarray of complex
+            Structure factor for every k-vector.
+        """
+        if self.phase_tables:
+            return structure_factor_tables(np.ascontiguousarray(positions, dtype=np.float64),
+                                           np.ascontiguousarray(charges, dtype=np.float64),
+                                           self._k_integers, self.system_conf.box_size)
+        return np.einsum('ik, k', np.exp(1j * np.einsum('ji, ki', self.k_vectors, positions)), charges)
+
+    def _reciprocal_energy(self, structure_factor):
+        r"""
+        Calculates the longrange potential (without self-interaction) for a given structure factor.
+        """
+        structure_factor_squared = structure_factor.real**2 + structure_factor.imag**2
+
+        return np.dot(structure_factor_squared, self._k_weights)
 
     def get_iterations(self):
         r'''
@@ -106,4 +288,313 @@ class EwaldSummation(object):
 
         '''
 
-        return len(self.k_vectors) * len(self.positions)
\ No newline at end of file
+        return len(self.k_vectors) * len(self.positions)
+
+class SPMEEwaldSummation(object):
+    r"""
+    Smooth Particle Mesh Ewald summation. The charges are spread on a regular mesh with
+    cardinal B-splines and the reciprocal sum is evaluated with FFTs, so the costs are
+    O(N log N) instead of O(N*K).
+
+    Parameters
+    ----------
+    system_conf : :obj:
+        System configuration containing all parameters for the simulation.
+    sigma : float
+        Standard deviation of Gaussian charge distribution.
+    k_cutoff : float
+        Cutoff-radius in reciprocal space. Only kept for compatibility with EwaldSummation,
+        the resolution in reciprocal space is given by the mesh.
+    mesh_size : int, optional, default=None
+        Number of mesh points per dimension. None: estimated from sigma and the
+        p_error of the system configuration.
+    order : int, optional, default=6
+        Order of the B-splines used for the charge assignment.
+
+    """
+    def __init__(self, system_conf, sigma, k_cutoff=None, mesh_size=None, order=6):
+        if order < 2:
+            raise ValueError('order of the B-splines must be at least 2')
+        self.system_conf = system_conf
+        self.positions = system_conf.xyz # Original Positions
+        self.charges = system_conf.charges
+        self.volume = system_conf.volume
+        self.box_size = system_conf.box_size
+        self.p_error = system_conf.p_error
+        self.order = order
+        self.k_cutoff = k_cutoff
+        self._fixed_mesh_size = mesh_size
+        self._energy = None
+        self._trial = None
+        self.sigma = sigma
+
+    @property
+    def sigma(self):
+        return self._sigma
+
+    @sigma.setter
+    def sigma(self, value):
+        self._sigma = value
+        self.sigma_sq = value * value
+        self._update_constants()
+
+    def _estimate_mesh_size(self):
+        r"""
+        Estimates the number of mesh points per dimension, so that the Gaussian damping
+        exp(-sigma^2 k^2 / 2) at the largest wave vector of the mesh is below e^-p_error.
+
+        Returns
+        -------
+        int
+            Even number of mesh points with only 2, 3 and 5 as prime factors.
+        """
+        k_max = np.sqrt(2 * self.p_error) / self.sigma
+        # Nyquist wave vector pi * M / L has to reach k_max, the factor 2 reduces the
+        # aliasing error of the B-spline interpolation
+        mesh_size = max(2 * self.order, int(np.ceil(2 * k_max * self.box_size / np.pi)))
+        while True:
+            m = mesh_size
+            for prime in (2, 3, 5):
+                while m % prime == 0:
+                    m //= prime
+            if m == 1 and mesh_size % 2 == 0:
+                return mesh_size
+            mesh_size += 1
+
+    def _update_constants(self):
+        r"""
+        Calculates the influence function on the mesh and the self-interaction energy.
+        Called whenever sigma changes.
+        """
+        if self._fixed_mesh_size is None:
+            self.mesh_size = self._estimate_mesh_size()
+        else:
+            self.mesh_size = int(self._fixed_mesh_size)
+        mesh_size = self.mesh_size
+
+        # Integer wave numbers of the (real) FFT mesh
+        m_full = np.fft.fftfreq(mesh_size, 1. / mesh_size)
+        m_half = np.fft.rfftfreq(mesh_size, 1. / mesh_size)
+
+        # Squared moduli of the B-spline Euler exponentials
+        b_sq_full = self._bspline_moduli(mesh_size)
+        b_sq_half = b_sq_full[:len(m_half)]
+
+        k_x = 2 * np.pi * m_full[:, None, None] / self.box_size
+        k_y = 2 * np.pi * m_full[None, :, None] / self.box_size
+        k_z = 2 * np.pi * m_half[None, None, :] / self.box_size
+        k_sq = k_x**2 + k_y**2 + k_z**2
+        k_sq[0, 0, 0] = 1.
+
+        influence = np.exp(-self.sigma_sq * k_sq / 2) / k_sq * \
+                    b_sq_full[:, None, None] * b_sq_full[None, :, None] * b_sq_half[None, None, :]
+        influence[0, 0, 0] = 0.
+
+        # The real FFT only stores half of the mesh; all other planes stand for two wave vectors
+        multiplicity = np.full(len(m_half), 2.)
+        multiplicity[0] = 1.
+        if mesh_size % 2 == 0:
+            multiplicity[-1] = 1.
+
+        self._influence = influence * multiplicity[None, None, :] * prefactor / (2 * self.volume)
+        self._self_interaction_potential = np.dot(self.charges.T, self.charges) * \
+                                           1 / (np.sqrt(2*np.pi) * self.sigma) * 1/( 4 * np.pi) * prefactor
+
+    def _bspline(self, u, order):
+        r"""
+        Evaluates the cardinal B-spline M_n(u) of order n by the recursion
+        M_n(u) = (u M_(n-1)(u) + (n - u) M_(n-1)(u - 1)) / (n - 1).
+
+        Parameters
+        ----------
+        u : numpy.ndarray of floats
+        order : int
+
+        Returns
+        -------
+        numpy.ndarray of floats
+        """
+        if order == 2:
+            return np.where((u >= 0) & (u <= 2), 1 - np.abs(u - 1), 0.)
+        return (u * self._bspline(u, order - 1) + (order - u) * self._bspline(u - 1, order - 1)) / (order - 1)
+
+    def _bspline_moduli(self, mesh_size):
+        r"""
+        Calculates |b(m)|^2 of the Euler exponential spline for all mesh frequencies.
+        """
+        k = np.arange(self.order - 1)
+        spline = self._bspline(k + 1., self.order)
+        m = np.arange(mesh_size)
+        denominator = np.abs(np.exp(2j * np.pi * np.outer(m, k) / mesh_size).dot(spline))**2
+        # for odd orders the denominator vanishes at the Nyquist frequency
+        return np.where(denominator > 1e-10, 1. / np.maximum(denominator, 1e-10), 0.)
+
+    def _spread_charges(self, positions):
+        r"""
+        Assigns the charges to the mesh with B-splines of order self.order.
+
+        Parameters
+        ----------
+        positions : array-like of floats
+            Positions of all particles inside the box.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(M, M, M))
+            Charge mesh.
+        """
+        mesh_size, order = self.mesh_size, self.order
+        u = np.asarray(positions) * mesh_size / self.box_size
+        base = np.floor(u).astype(int)
+        fraction = u - base
+
+        # Weights and mesh indices of the order grid points in every dimension, shape=(n, 3, order)
+        shifts = np.arange(order)
+        weights = self._bspline(fraction[:, :, None] + shifts, order)
+        indices = (base[:, :, None] - shifts) % mesh_size
+
+        values = self.charges[:, None, None, None] * weights[:, 0, :, None, None] * \
+                 weights[:, 1, None, :, None] * weights[:, 2, None, None, :]
+        flat_indices = (indices[:, 0, :, None, None] * mesh_size + indices[:, 1, None, :, None]) * mesh_size + \
+                       indices[:, 2, None, None, :]
+
+        charge_mesh = np.bincount(flat_indices.ravel(), weights=values.ravel(), minlength=mesh_size**3)
+        return charge_mesh.reshape((mesh_size, mesh_size, mesh_size))
+
+    def longrange_energy(self, positions):
+        r"""
+        Calculates the longrange potential and the self interaction potential
+        of a given particle distribution using Smooth Particle Mesh Ewald.
+
+        Atomic Units are used.
+
+        Parameters
+        ----------
+        positions : array-like of floats
+            Current position of all particles inside the box.
+
+        Returns
+        -------
+        float
+            long-range and self-interaction potential
+
+        """
+        self.positions = positions
+
+        structure_factor = np.fft.rfftn(self._spread_charges(positions))
+        structure_factor_squared = structure_factor.real**2 + structure_factor.imag**2
+        longrange_potential = np.sum(structure_factor_squared * self._influence)
+
+        return longrange_potential - self._self_interaction_potential
+
+    def longrange_energy_batch(self, positions):
+        r"""
+        Calculates the longrange potential and the self interaction potential of
+        several particle distributions.
+
+        Parameters
+        ----------
+        positions : array-like of floats, shape=(b, n, 3)
+            Positions of all particles inside the box for b configurations.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(b,))
+            long-range and self-interaction potential of every configuration
+
+        """
+        charge_meshes = np.array([self._spread_charges(frame) for frame in positions])
+        structure_factors = np.fft.rfftn(charge_meshes, axes=(1, 2, 3))
+        structure_factors_squared = structure_factors.real**2 + structure_factors.imag**2
+        longrange_potential = np.einsum('bijk, ijk -> b', structure_factors_squared, self._influence)
+
+        return longrange_potential - self._self_interaction_potential
+
+    def init_structure_factor(self, positions):
+        r"""
+        Stores the energy of a configuration as reference for following calls of delta_energy.
+        The mesh has no cheap update for moved particles, so delta_energy recalculates the energy.
+
+        Parameters
+        ----------
+        positions : array-like of floats
+            Current position of all particles inside the box.
+        """
+        self._positions = np.array(positions, dtype=float)
+        self._energy = self.longrange_energy(self._positions)
+        self._trial = None
+
+    def delta_energy(self, indices, old_positions, new_positions):
+        r"""
+        Calculates the change of the longrange energy if particles are moved.
+
+        Parameters
+        ----------
+        indices : int or array-like of int
+            Indices of the moved particles.
+        old_positions : array-like of floats, shape=(m, 3) or (3,)
+            Positions of the particles in the stored configuration.
+        new_positions : array-like of floats, shape=(m, 3) or (3,)
+            Trial positions of the particles.
+
+        Returns
+        -------
+        float
+            Difference of the longrange energy between trial and stored configuration.
+        """
+        if self._energy is None:
+            raise ValueError('energy is not initialized, call init_structure_factor first')
+        indices = np.atleast_1d(indices)
+        positions = self._positions.copy()
+        positions[indices] = np.reshape(new_positions, (len(indices), 3))
+        energy = self.longrange_energy(positions)
+        self._trial = positions, energy
+        return energy - self._energy
+
+    def commit(self):
+        r"""
+        Accepts the trial move of the last delta_energy call.
+        """
+        if self._trial is None:
+            raise ValueError('no trial move to commit')
+        self._positions, self._energy = self._trial
+        self._trial = None
+
+    def rollback(self):
+        r"""
+        Rejects the trial move of the last delta_energy call.
+        """
+        self._trial = None
+
+    def get_incremental_state(self):
+        r"""
+        Returns
+        -------
+        tuple
+            Stored configuration and energy, can be passed to set_incremental_state.
+        """
+        return self._positions, self._energy
+
+    def set_incremental_state(self, state):
+        r"""
+        Parameters
+        ----------
+        state : tuple
+            State returned by get_incremental_state.
+        """
+        self._positions, self._energy = state
+        self._trial = None
+
+    def get_iterations(self):
+        r'''
+        Function is used to calculate the time per iteration for the long-range Ewald summation.
+        This time is used to calculate the optimal cutoff parameters.
+
+        Returns
+        -------
+        it : int
+            Number of steps for calculating the potential
+
+        '''
+        n_mesh = self.mesh_size**3
+        return len(self.positions) * self.order**3 + int(n_mesh * np.log2(n_mesh))
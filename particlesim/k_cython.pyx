@@ -19,7 +19,9 @@
 import numpy as np
 import cython
 cimport numpy as np
-from libc.math cimport sqrt
+from cython.parallel cimport prange
+from libc.math cimport sqrt, cos, sin, floor, erfc, M_PI, M_SQRT2
+from scipy.linalg.cython_blas cimport zgemm
 
 DTYPE = np.int
 ctypedef np.int_t DTYPE_t
@@ -56,6 +58,37 @@ def calc_k_vectors(int K):
 
     return np.array(k_vectors)
 
+def calc_k_vectors_half(int K):
+    """
+    Calculates the k vectors of one half space of our lattice until a cutoff Value K.
+    For every pair k, -k exactly one vector is returned, namely the one with the first
+    nonzero component positive. Because of S(-k) = conj(S(k)), sums over the full sphere
+    equal twice the sum over these vectors.
+
+    Parameters
+    ----------
+    K : int
+        Cutoff value for the absolute value of the k-vectors
+
+
+    Returns
+    -------
+    k_vectors : ndarray
+        Array of k vectors of the half space that have an absolute value below cutoff K
+    """
+    cdef int b_limit, c_limit
+
+    k_vectors = []
+
+    for a in range(0, K + 1):
+        b_limit = int((K ** 2 - a ** 2)**.5)
+        for b in range(-b_limit if a > 0 else 0, b_limit + 1):
+            c_limit = int((K ** 2 - a ** 2 - b ** 2)**.5)
+            for c in range(-c_limit if a > 0 or b > 0 else 1, c_limit + 1):
+                k_vectors.append([a, b, c])
+
+    return np.array(k_vectors).reshape(-1, 3)
+
 def calc_k_vectors_test(int K):
     """
     Function for testing and speedup
@@ -85,6 +118,172 @@ def calc_k_vectors_test(int K):
 
     return k_vectors
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def structure_factor_tables(double[:, :] xyz, double[:] charges, long[:, :] k_vectors, double box_len):
+    """
+    Calculates the structure factor S(k) = sum_j q_j exp(i 2 pi k r_j / L) for integer k-vectors.
+    For every axis a table of the phase factors exp(i 2 pi n x_j / L), n = 0..K, is built by
+    complex multiplications, so only one cos and sin per particle and axis are evaluated.
+    Negative components use the complex conjugate.
+
+    Parameters
+    ----------
+    xyz :       double[:,:]
+                position array
+    charges :   double[:]
+                charge of every particle
+    k_vectors : long[:,:]
+                integer k-vectors in multiples of 2 pi / L
+    box_len :   double
+                the length of the box
+
+    Return
+    ------
+    structure_factor : ndarray of complex
+        structure factor for every k-vector
+    """
+
+    cdef:
+        Py_ssize_t n = xyz.shape[0]
+        Py_ssize_t n_k = k_vectors.shape[0]
+        Py_ssize_t i, j, d
+        int K = 0
+        long a, b, c
+        double complex phase, px, py, pz, s
+        double angle
+
+    for i in range(n_k):
+        for d in range(3):
+            K = max(K, abs(k_vectors[i, d]))
+
+    structure_factor = np.empty(n_k, dtype=np.complex128)
+    cdef double complex[:] sf = structure_factor
+    cdef double complex[:, :, :] tables = np.empty((3, K + 1, n), dtype=np.complex128)
+
+    # Phase tables by recurrence e^(i n x) = e^(i (n-1) x) * e^(i x)
+    for d in range(3):
+        for j in range(n):
+            angle = 2 * M_PI * xyz[j, d] / box_len
+            phase = cos(angle) + 1j * sin(angle)
+            tables[d, 0, j] = 1
+            for i in range(1, K + 1):
+                tables[d, i, j] = tables[d, i - 1, j] * phase
+
+    for i in range(n_k):
+        a = k_vectors[i, 0]
+        b = k_vectors[i, 1]
+        c = k_vectors[i, 2]
+        s = 0
+        for j in range(n):
+            px = tables[0, a, j] if a >= 0 else tables[0, -a, j].conjugate()
+            py = tables[1, b, j] if b >= 0 else tables[1, -b, j].conjugate()
+            pz = tables[2, c, j] if c >= 0 else tables[2, -c, j].conjugate()
+            s = s + charges[j] * px * py * pz
+        sf[i] = s
+
+    return structure_factor
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def structure_factor_batch(double[:, :, :] xyz, double[:] charges, long[:, :] k_pairs, long[:] pair_index,
+                           long[:] k_z, double box_len):
+    """
+    Calculates the structure factor S(k) = sum_j q_j exp(i 2 pi k r_j / L) of a stack of configurations.
+    The k-vectors are grouped by their first two components (a, b): with
+    W[j, p] = q_j exp(i 2 pi (a_p x_j + b_p y_j) / L) and Z[j, c] = exp(i 2 pi c z_j / L)
+    the structure factor of all vectors on a grid of pairs and z-components is the matrix
+    product W^T Z, which is evaluated with BLAS (zgemm). The phase factors are built from
+    tables like in structure_factor_tables.
+
+    Parameters
+    ----------
+    xyz :        double[:,:,:]
+                 positions of all configurations, shape (b, n, 3)
+    charges :    double[:]
+                 charge of every particle
+    k_pairs :    long[:,:]
+                 unique first two components (a, b) of the integer k-vectors
+    pair_index : long[:]
+                 index into k_pairs of every k-vector
+    k_z :        long[:]
+                 third component c of every k-vector
+    box_len :    double
+                 the length of the box
+
+    Return
+    ------
+    structure_factor : ndarray of complex, shape (b, n_k)
+        structure factor of every configuration and k-vector
+    """
+
+    cdef:
+        Py_ssize_t n_frames = xyz.shape[0]
+        Py_ssize_t n = xyz.shape[1]
+        Py_ssize_t n_pairs = k_pairs.shape[0]
+        Py_ssize_t n_k = k_z.shape[0]
+        Py_ssize_t f, i, j, d
+        long a, b, c, c_min = 0, c_max = 0
+        int K = 0, m, n_c, n_int, n_pairs_int
+        double complex phase, px, py
+        double complex one = 1, zero = 0
+        double angle
+        char transa = b'N'
+        char transb = b'T'
+
+    for i in range(n_pairs):
+        K = max(K, abs(k_pairs[i, 0]), abs(k_pairs[i, 1]))
+    for i in range(n_k):
+        K = max(K, abs(k_z[i]))
+        c_min = min(c_min, k_z[i])
+        c_max = max(c_max, k_z[i])
+    n_c = c_max - c_min + 1
+    n_int = n
+    n_pairs_int = n_pairs
+
+    structure_factor = np.empty((n_frames, n_k), dtype=np.complex128)
+    cdef double complex[:, :] sf = structure_factor
+    cdef double complex[:, :, :] tables = np.empty((3, K + 1, n), dtype=np.complex128)
+    cdef double complex[:, :] w = np.empty((n, n_pairs), dtype=np.complex128)
+    cdef double complex[:, :] z = np.empty((n, n_c), dtype=np.complex128)
+    cdef double complex[:, :] grid = np.empty((n_pairs, n_c), dtype=np.complex128)
+
+    if n == 0 or n_k == 0:
+        structure_factor[:] = 0
+        return structure_factor
+
+    with nogil:
+        for f in range(n_frames):
+            # Phase tables by recurrence e^(i m x) = e^(i (m-1) x) * e^(i x)
+            for d in range(3):
+                for j in range(n):
+                    angle = 2 * M_PI * xyz[f, j, d] / box_len
+                    phase = cos(angle) + 1j * sin(angle)
+                    tables[d, 0, j] = 1
+                    for m in range(1, K + 1):
+                        tables[d, m, j] = tables[d, m - 1, j] * phase
+
+            for j in range(n):
+                for i in range(n_pairs):
+                    a = k_pairs[i, 0]
+                    b = k_pairs[i, 1]
+                    px = tables[0, a, j] if a >= 0 else tables[0, -a, j].conjugate()
+                    py = tables[1, b, j] if b >= 0 else tables[1, -b, j].conjugate()
+                    w[j, i] = charges[j] * px * py
+                for i in range(n_c):
+                    c = c_min + i
+                    z[j, i] = tables[2, c, j] if c >= 0 else tables[2, -c, j].conjugate()
+
+            # grid = W^T Z; in column-major order the row-major arrays are transposed,
+            # so this is grid^T = Z^T W computed as zgemm('N', 'T') of z and w.
+            zgemm(&transa, &transb, &n_c, &n_pairs_int, &n_int, &one, &z[0, 0], &n_c,
+                  &w[0, 0], &n_pairs_int, &zero, &grid[0, 0], &n_c)
+
+            for i in range(n_k):
+                sf[f, i] = grid[pair_index[i], k_z[i] - c_min]
+
+    return structure_factor
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
 def fast_distances(double[:, :] xyz, double box_len, double[:,:] distances):
@@ -165,4 +364,301 @@ cpdef fast_distances_cpdef(double[:, :] xyz, double box_len, double[:,:] distanc
             distances[i,j] = distance
             distances[j,i] = distance
 
-    return
\ No newline at end of file
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef inline double _periodic_distance_sq(double[:, :] xyz, Py_ssize_t i, Py_ssize_t j, double box_len) nogil:
+    """
+    Squared minimum image distance of the particles i and j.
+    """
+    cdef:
+        Py_ssize_t k
+        double vec, distance_sq = 0
+    for k in range(xyz.shape[1]):
+        vec = xyz[i, k] - xyz[j, k]
+        vec = vec - box_len * floor(vec / box_len + 0.5)
+        distance_sq += vec * vec
+    return distance_sq
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def fast_shortrange_energy(double[:, :] xyz, double[:] charges, long[:] types, double[:, :] sigmas,
+                           double[:, :] epsilons, double[:, :] lj_cutoffs, double r_cutoff, double sigma_c, double box_len,
+                           bint lj=True, bint coulomb=True):
+    """
+    Calculates the Lennard-Jones energy and the shortrange part of the Ewald summation in one pass over all
+    particle pairs without storing their distances.
+
+    Parameters
+    ----------
+    xyz :        double[:,:]
+                 position array
+    charges :    double[:]
+                 charge of every particle
+    types :      long[:]
+                 Lennard-Jones type of every particle
+    sigmas :     double[:,:]
+                 Lennard-Jones sigma of every pair of types
+    epsilons :   double[:,:]
+                 Lennard-Jones epsilon of every pair of types
+    lj_cutoffs : double[:,:]
+                 Lennard-Jones cutoff of every pair of types
+    r_cutoff :   double
+                 cutoff of the shortrange coulomb interaction
+    sigma_c :    double
+                 standard deviation of the Gaussian charge distribution
+    box_len :    double
+                 the length of the box for the periodic boundry
+    lj :         bool
+                 if true calculate the Lennard-Jones energy
+    coulomb :    bool
+                 if true calculate the coulomb energy
+
+    Return
+    ------
+    lj_energy : double
+        Lennard-Jones energy
+    coulomb_energy : double
+        sum of q_i q_j erfc(r / (sqrt(2) sigma_c)) / r, without the coulomb prefactor
+    """
+
+    cdef:
+        Py_ssize_t n = xyz.shape[0]
+        Py_ssize_t i, j, type_i, type_j
+        double distance_sq, distance, cutoff, q
+        double r_cutoff_sq = r_cutoff * r_cutoff
+        double erfc_scale = 1.0 / (M_SQRT2 * sigma_c)
+        double lj_energy = 0, coulomb_energy = 0
+
+    with nogil:
+        for i in range(n):
+            type_i = types[i]
+            for j in range(i + 1, n):
+                distance_sq = _periodic_distance_sq(xyz, i, j, box_len)
+                if lj:
+                    type_j = types[j]
+                    cutoff = lj_cutoffs[type_i, type_j]
+                    if distance_sq < cutoff * cutoff:
+                        q = sigmas[type_i, type_j] * sigmas[type_i, type_j] / distance_sq
+                        q = q * q * q
+                        lj_energy += 4.0 * epsilons[type_i, type_j] * q * (q - 1.0)
+                if coulomb and distance_sq < r_cutoff_sq:
+                    distance = sqrt(distance_sq)
+                    coulomb_energy += charges[i] * charges[j] / distance * erfc(distance * erfc_scale)
+
+    return lj_energy, coulomb_energy
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def fast_shortrange_energy_parallel(double[:, :] xyz, double[:] charges, long[:] types, double[:, :] sigmas,
+                                    double[:, :] epsilons, double[:, :] lj_cutoffs, double r_cutoff, double sigma_c, double box_len,
+                                    bint lj=True, bint coulomb=True, int num_threads=1):
+    """
+    Multithreaded variant of fast_shortrange_energy. The rows of the pair loop are distributed
+    dynamically over num_threads OpenMP threads, which sum up their own partial energies.
+
+    Parameters
+    ----------
+    xyz :         double[:,:]
+                  position array
+    charges :     double[:]
+                  charge of every particle
+    types :       long[:]
+                  Lennard-Jones type of every particle
+    sigmas :      double[:,:]
+                  Lennard-Jones sigma of every pair of types
+    epsilons :    double[:,:]
+                  Lennard-Jones epsilon of every pair of types
+    lj_cutoffs :  double[:,:]
+                  Lennard-Jones cutoff of every pair of types
+    r_cutoff :    double
+                  cutoff of the shortrange coulomb interaction
+    sigma_c :     double
+                  standard deviation of the Gaussian charge distribution
+    box_len :     double
+                  the length of the box for the periodic boundry
+    lj :          bool
+                  if true calculate the Lennard-Jones energy
+    coulomb :     bool
+                  if true calculate the coulomb energy
+    num_threads : int
+                  number of threads
+
+    Return
+    ------
+    lj_energy : double
+        Lennard-Jones energy
+    coulomb_energy : double
+        sum of q_i q_j erfc(r / (sqrt(2) sigma_c)) / r, without the coulomb prefactor
+    """
+
+    cdef:
+        Py_ssize_t n = xyz.shape[0]
+        Py_ssize_t i, j, type_i, type_j
+        double distance_sq, distance, cutoff, q
+        double r_cutoff_sq = r_cutoff * r_cutoff
+        double erfc_scale = 1.0 / (M_SQRT2 * sigma_c)
+        double lj_energy = 0, coulomb_energy = 0
+
+    for i in prange(n, nogil=True, schedule='dynamic', num_threads=num_threads):
+        type_i = types[i]
+        for j in range(i + 1, n):
+            distance_sq = _periodic_distance_sq(xyz, i, j, box_len)
+            if lj:
+                type_j = types[j]
+                cutoff = lj_cutoffs[type_i, type_j]
+                if distance_sq < cutoff * cutoff:
+                    q = sigmas[type_i, type_j] * sigmas[type_i, type_j] / distance_sq
+                    q = q * q * q
+                    lj_energy += 4.0 * epsilons[type_i, type_j] * q * (q - 1.0)
+            if coulomb and distance_sq < r_cutoff_sq:
+                distance = sqrt(distance_sq)
+                coulomb_energy += charges[i] * charges[j] / distance * erfc(distance * erfc_scale)
+
+    return lj_energy, coulomb_energy
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def fast_pair_distances(double[:, :] xyz, Py_ssize_t start, Py_ssize_t stop, double box_len, double[:] distances,
+                        int num_threads=1):
+    """
+    Calculates the distances of all pairs (i, j) with start <= i < stop and i < j in row-major order, so
+    only a block of rows of the upper triangle of the distance matrix is stored.
+
+    Parameters
+    ----------
+    xyz :         double[:,:]
+                  position array
+    start :       Py_ssize_t
+                  first row of the block
+    stop :        Py_ssize_t
+                  end of the block, exclusive
+    box_len :     double
+                  the length of the box for the periodic boundry
+    distances :   double[:]
+                  an array of length sum(n - 1 - i for i in range(start, stop)) for the pair distances
+    num_threads : int
+                  number of threads
+
+    Return
+    ------
+        void
+    """
+
+    cdef:
+        Py_ssize_t n = xyz.shape[0]
+        Py_ssize_t i, j, offset
+
+    for i in prange(start, stop, nogil=True, schedule='dynamic', num_threads=num_threads):
+        # Number of pairs in the rows start, ..., i - 1
+        offset = (i - start) * (n - 1) - (i * (i - 1) - start * (start - 1)) // 2
+        for j in range(i + 1, n):
+            distances[offset + j - i - 1] = sqrt(_periodic_distance_sq(xyz, i, j, box_len))
+
+    return
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def fast_shortrange_energy_batch(double[:, :, :] xyz, double[:] charges, long[:] types, double[:, :] sigmas,
+                                 double[:, :] epsilons, double[:, :] lj_cutoffs, double r_cutoff, double sigma_c,
+                                 double box_len, double[:] lj_energies, double[:] coulomb_energies,
+                                 bint lj=True, bint coulomb=True, int num_threads=1):
+    """
+    Variant of fast_shortrange_energy for a stack of configurations. The loop over the particle
+    pairs is the outer loop, so the parameters of a pair are looked up once for all configurations
+    and the inner loop over the configurations reads contiguous memory. The configurations are
+    split into num_threads blocks, every thread evaluates one block.
+
+    The positions have to be inside the box, [0, box_len), so that a single shift by box_len
+    gives the minimum image.
+
+    Parameters
+    ----------
+    xyz :              double[:,:,:]
+                       positions of all configurations with shape (n, 3, b), i.e. the configuration is the last axis
+    charges :          double[:]
+                       charge of every particle
+    types :            long[:]
+                       Lennard-Jones type of every particle
+    sigmas :           double[:,:]
+                       Lennard-Jones sigma of every pair of types
+    epsilons :         double[:,:]
+                       Lennard-Jones epsilon of every pair of types
+    lj_cutoffs :       double[:,:]
+                       Lennard-Jones cutoff of every pair of types
+    r_cutoff :         double
+                       cutoff of the shortrange coulomb interaction
+    sigma_c :          double
+                       standard deviation of the Gaussian charge distribution
+    box_len :          double
+                       the length of the box for the periodic boundry
+    lj_energies :      double[:]
+                       an array for the Lennard-Jones energy of every configuration
+    coulomb_energies : double[:]
+                       an array for the coulomb energy of every configuration, without the coulomb prefactor
+    lj :               bool
+                       if true calculate the Lennard-Jones energy
+    coulomb :          bool
+                       if true calculate the coulomb energy
+    num_threads :      int
+                       number of threads
+
+    Return
+    ------
+        void
+    """
+
+    cdef:
+        Py_ssize_t n = xyz.shape[0]
+        Py_ssize_t n_frames = xyz.shape[2]
+        Py_ssize_t n_blocks = max(1, min(num_threads, n_frames))
+        Py_ssize_t block, start, stop, b, i, j, type_i, type_j
+        double half = 0.5 * box_len
+        double vec, distance_sq, distance, q, sigma_sq, epsilon_4, cutoff_sq, charge_product
+        double r_cutoff_sq = r_cutoff * r_cutoff
+        double erfc_scale = 1.0 / (M_SQRT2 * sigma_c)
+        double[:] distances_sq = np.empty(n_frames)
+
+    for block in prange(n_blocks, nogil=True, schedule='static', num_threads=num_threads):
+        start = block * n_frames // n_blocks
+        stop = (block + 1) * n_frames // n_blocks
+        for b in range(start, stop):
+            lj_energies[b] = 0
+            coulomb_energies[b] = 0
+        for i in range(n):
+            type_i = types[i]
+            for j in range(i + 1, n):
+                type_j = types[j]
+                sigma_sq = sigmas[type_i, type_j] * sigmas[type_i, type_j]
+                epsilon_4 = 4.0 * epsilons[type_i, type_j]
+                cutoff_sq = lj_cutoffs[type_i, type_j] * lj_cutoffs[type_i, type_j]
+                charge_product = charges[i] * charges[j]
+                # Branchless minimum image, the difference of two positions inside the box is in (-L, L)
+                for b in range(start, stop):
+                    vec = xyz[i, 0, b] - xyz[j, 0, b]
+                    vec = vec - box_len * ((vec > half) - (vec < -half))
+                    distance_sq = vec * vec
+                    vec = xyz[i, 1, b] - xyz[j, 1, b]
+                    vec = vec - box_len * ((vec > half) - (vec < -half))
+                    distance_sq = distance_sq + vec * vec
+                    vec = xyz[i, 2, b] - xyz[j, 2, b]
+                    vec = vec - box_len * ((vec > half) - (vec < -half))
+                    distances_sq[b] = distance_sq + vec * vec
+                for b in range(start, stop):
+                    distance_sq = distances_sq[b]
+                    if lj and distance_sq < cutoff_sq:
+                        q = sigma_sq / distance_sq
+                        q = q * q * q
+                        lj_energies[b] += epsilon_4 * q * (q - 1.0)
+                    if coulomb and charge_product != 0 and distance_sq < r_cutoff_sq:
+                        distance = sqrt(distance_sq)
+                        coulomb_energies[b] += charge_product / distance * erfc(distance * erfc_scale)
+
+    return
@@ -17,6 +17,75 @@
 
 import numpy as np
 import itertools as it
+from scipy.spatial import cKDTree
+
+# Offsets of the 13 forward neighbour cells. Together with the pairs inside a cell they
+# visit every unordered pair of neighbouring particles exactly once.
+_HALF_SHELL = np.array([o for o in it.product((-1, 0, 1), repeat=3) if o > (0, 0, 0)], dtype=int)
+
+
+def _full_stencil(nr_cells):
+    r"""
+    Offsets of all neighbouring cells (including the cell itself). Offsets that lead
+    to the same cell because of less than three cells per dimension are only used once.
+    """
+    offsets = sorted(set(o % nr_cells for o in (-1, 0, 1)))
+    return np.array(list(it.product(offsets, repeat=3)), dtype=int)
+
+
+def _enumerate_cell_pairs(particles_in_cell, nr_cells, half_shell=True):
+    r"""
+    Enumerates candidate pairs of particles in neighbouring cells cell by cell.
+
+    Parameters
+    ----------
+    particles_in_cell : callable
+        Returns the particle indices of the cell (x, y, z) as list or array.
+    nr_cells : int
+        Number of cells per dimension.
+    half_shell : bool
+        True: visit the cell itself and its 13 forward neighbours, so every pair is enumerated once.
+        False: visit all neighbouring cells and drop the pairs with j <= i afterwards.
+        Less than three cells per dimension always use the second method, because forward
+        and backward neighbours are the same cell then.
+
+    Returns
+    -------
+    ndarray(m), int
+        Smaller index of every candidate pair.
+    ndarray(m), int
+        Larger index of every candidate pair.
+    """
+    half_shell = half_shell and nr_cells >= 3
+    stencil = _HALF_SHELL if half_shell else _full_stencil(nr_cells)
+    cells = {}
+    for cell in it.product(range(nr_cells), repeat=3):
+        cells[cell] = np.asarray(particles_in_cell(*cell), dtype=int)
+
+    pairs_i, pairs_j = [np.empty(0, dtype=int)], [np.empty(0, dtype=int)]
+    for cell, own in cells.items():
+        if len(own) == 0:
+            continue
+        if half_shell:
+            first, second = np.triu_indices(len(own), 1)
+            pairs_i.append(own[first])
+            pairs_j.append(own[second])
+        for offset in stencil:
+            other = cells[tuple((np.array(cell) + offset) % nr_cells)]
+            pairs_i.append(np.repeat(own, len(other)))
+            pairs_j.append(np.tile(other, len(own)))
+    i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+    if not half_shell:
+        keep = i < j
+        i, j = i[keep], j[keep]
+    return np.minimum(i, j), np.maximum(i, j)
+
+
+def _periodic_distances(pos_i, pos_j, box_size):
+    vec = pos_i - pos_j
+    vec -= box_size * np.round(vec / box_size)
+    return np.sqrt(np.einsum('ij,ij->i', vec, vec))
+
 
 class Neighbouring(object):
     r"""
@@ -60,6 +129,61 @@ class Neighbouring(object):
     def get_particles_within_radius(self, particle_id):
         pass
 
+    def all_pairs(self):
+        r"""
+        Find all pairs of particles within the cutoff-radius.
+
+        Returns
+        -------
+        ndarray(m), int
+            Index i of every pair.
+        ndarray(m), int
+            Index j > i of every pair.
+        ndarray(m), float
+            Distance of every pair.
+        """
+        raise NotImplementedError('%s does not provide pair arrays' % type(self).__name__)
+
+    def csr_neighbourlist(self, displacements=False):
+        r"""
+        Neighbours of all particles in compressed sparse row format. The neighbours of
+        particle i are indices[offsets[i]:offsets[i+1]], so they can be sliced without copies
+        and per-particle sums can be computed with np.add.reduceat.
+
+        Parameters
+        ----------
+        displacements : bool, optional, default=False
+            If true also return the minimum image vectors from every particle to its neighbours.
+
+        Returns
+        -------
+        offsets : ndarray(n+1), int
+            Start of the neighbours of every particle; offsets[n] is the total number of entries.
+        indices : ndarray(m), int
+            Indices of the neighbours.
+        distances : ndarray(m), float
+            Distances to the neighbours.
+        vectors : ndarray(m, 3), float
+            Minimum image vectors from the particle to its neighbours, only if displacements is True.
+        """
+        i, j, distances = self.all_pairs()
+        rows = np.concatenate((i, j))
+        order = np.argsort(rows, kind='stable')
+        rows = rows[order]
+        indices = np.concatenate((j, i))[order]
+        distances = np.concatenate((distances, distances))[order]
+
+        offsets = np.zeros(self.n + 1, dtype=int)
+        np.cumsum(np.bincount(rows, minlength=self.n), out=offsets[1:])
+
+        if not displacements:
+            return offsets, indices, distances
+
+        pos = self.particle_positions
+        vectors = pos[indices] - pos[rows]
+        vectors -= self.box_size * np.round(vectors / self.box_size)
+        return offsets, indices, distances, vectors
+
 
 class NeighbouringPrimitiveLists(Neighbouring):
     r"""
@@ -110,6 +234,24 @@ class NeighbouringPrimitiveLists(Neighbouring):
         """
         return self._neighbourlist[particle_id]  # returns the indices of the points
 
+    def all_pairs(self):
+        r"""
+        Find all pairs of particles within the cutoff-radius by checking every pair, O(n^2).
+
+        Returns
+        -------
+        ndarray(m), int
+            Index i of every pair.
+        ndarray(m), int
+            Index j > i of every pair.
+        ndarray(m), float
+            Distance of every pair.
+        """
+        i, j = np.triu_indices(self.n, 1)
+        distances = _periodic_distances(self.particle_positions[i], self.particle_positions[j], self.box_size)
+        keep = distances < self.r
+        return i[keep], j[keep], distances[keep]
+
 
 class NeighbouringCellLinkedLists(Neighbouring):
     r"""
@@ -186,6 +328,31 @@ class NeighbouringCellLinkedLists(Neighbouring):
         return ret_idx, ret_dist
 
 
+    def all_pairs(self, half_shell=True):
+        r"""
+        Find all pairs of particles within the cutoff-radius.
+
+        Parameters
+        ----------
+        half_shell : bool, optional, default=True
+            Only visit the 13 forward neighbour cells, so every pair is checked once.
+
+        Returns
+        -------
+        ndarray(m), int
+            Index i of every pair.
+        ndarray(m), int
+            Index j > i of every pair.
+        ndarray(m), float
+            Distance of every pair.
+        """
+        pos, cell_ll = self.particle_positions, self._neighbourlist
+        i, j = _enumerate_cell_pairs(lambda x, y, z: cell_ll[x][y][z], self.nr_cells, half_shell)
+        distances = _periodic_distances(pos[i], pos[j], self.box_size)
+        within = distances < self.r
+        return i[within], j[within], distances[within]
+
+
     def update_cells(self, new_positions):
         r"""
         Updates the cell-linked list.
@@ -221,9 +388,11 @@ class NeighbouringCellLinkedListsArray(Neighbouring):
         self.box_size = float(box_size)
         self.nr_cells_one_d = int(max(1, self.box_size / self.r))
         self.nr_cells = self.nr_cells_one_d**3
-        self._cell_len =  self.r + (self.box_size % self.r )/self.nr_cells
+        self._cell_len = self.box_size / self.nr_cells_one_d
+        self._cell_dir = _full_stencil(self.nr_cells_one_d)
         self.head = np.ones(self.nr_cells, dtype=int) * -1
         self.cell_ll = np.ones(self.n, dtype=int) * -1
+        self.particle_cell = np.ones(self.n, dtype=int) * -1
         self.update_neighbourlist(self.particle_positions)
 
 
@@ -237,14 +406,58 @@ class NeighbouringCellLinkedListsArray(Neighbouring):
             Position of n particles in x,y,z coordinates.
 
         """
+        # private copy, move_particle changes single positions
+        self.particle_positions = np.array(xyz, dtype=float)
         self.head[:] = -1
         self.cell_ll[:] = -1
 
         for i in range(self.n):
-            cell_index = self._calc_cell_index(i, xyz)
-            old_head = self.head[cell_index]
-            self.head[cell_index] = i
-            self.cell_ll[i] = old_head
+            cell_index = self._calc_cell_index(i, self.particle_positions)
+            self._link(i, cell_index)
+
+
+    def _link(self, i, cell_index):
+        r"""
+        Inserts particle i at the head of a cell.
+        """
+        self.cell_ll[i] = self.head[cell_index]
+        self.head[cell_index] = i
+        self.particle_cell[i] = cell_index
+
+
+    def _unlink(self, i):
+        r"""
+        Removes particle i from the linked list of its cell in O(cell occupancy).
+        """
+        cell_index = self.particle_cell[i]
+        if self.head[cell_index] == i:
+            self.head[cell_index] = self.cell_ll[i]
+        else:
+            previous = self.head[cell_index]
+            while self.cell_ll[previous] != i:
+                previous = self.cell_ll[previous]
+            self.cell_ll[previous] = self.cell_ll[i]
+        self.cell_ll[i] = -1
+        self.particle_cell[i] = -1
+
+
+    def move_particle(self, i, new_pos):
+        r"""
+        Moves a single particle and relinks it into its new cell in O(cell occupancy)
+        instead of rebinning all particles.
+
+        Parameters
+        ----------
+        i : int
+            particle index
+        new_pos : ndarray(3), float
+            new position of particle i
+        """
+        self.particle_positions[i] = new_pos
+        cell_index = self._calc_cell_index(i, self.particle_positions)
+        if cell_index != self.particle_cell[i]:
+            self._unlink(i)
+            self._link(i, cell_index)
 
 
     def _get_particles_in_cell(self,cell_index):
@@ -270,6 +483,43 @@ class NeighbouringCellLinkedListsArray(Neighbouring):
         return particles_in_cell_idxs
 
 
+    def query_position(self, pos, exclude=None):
+        r"""
+        Find all particles within the cutoff-radius of an arbitrary position, e.g. the trial
+        position of a Monte Carlo move, without changing the neighbour-list.
+
+        Parameters
+        ----------
+        pos : ndarray(3), float
+            Position to check.
+        exclude : int, optional, default=None
+            Index of a particle that is left out, e.g. the moved particle itself.
+
+        Returns
+        -------
+        result_idx : ndarray (int)
+            Indices of all particles within the cutoff-radius.
+        result_dist : ndarray (float)
+            Distances from pos to these particles.
+        """
+        pos = np.asarray(pos, dtype=float)
+        cell = (pos / self._cell_len).astype(int) % self.nr_cells_one_d
+        cells = (cell + self._cell_dir) % self.nr_cells_one_d
+
+        candidates = []
+        for idx_x, idx_y, idx_z in cells:
+            candidates.extend(self._get_particles_in_cell(self._recalc_cell_index(idx_x, idx_y, idx_z)))
+        candidates = np.array(candidates, dtype=int)
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+
+        vec = pos - self.particle_positions[candidates]
+        vec -= self.box_size * np.round(vec / self.box_size)
+        distances = np.sqrt(np.einsum('ij,ij->i', vec, vec))
+        within = distances < self.r
+        return candidates[within], distances[within]
+
+
     def get_particles_within_radius(self, particle_id):
         r"""
         Find all neighbouring particles within the cutoff-radius and calculate their distances.
@@ -286,27 +536,34 @@ class NeighbouringCellLinkedListsArray(Neighbouring):
         result_dist : list (float)
             Distances from one particle to all neighbouring particles within the cutoff-radius.
         """
-        result_idx, result_dist = [], []
-
-        p = self.particle_positions[particle_id]
-        cell = (p / self._cell_len).astype("int")
-        cell_dir = np.array(list(it.product([-1,0,1],repeat=3)))
-        cells = np.array([(cell + cell_dir[i])%self.nr_cells for i in range(27)] )
+        result_idx, result_dist = self.query_position(self.particle_positions[particle_id], exclude=particle_id)
+        return result_idx.tolist(), result_dist.tolist()
 
-        for cell_idx in cells:
-            idx_x, idx_y, idx_z = cell_idx
-            cell_idx_one_dim = self._recalc_cell_index(idx_x, idx_y, idx_z)
-            cell_list = self._get_particles_in_cell(cell_idx_one_dim)
 
-            for neigh_idx in cell_list:
-                neigh = self.particle_positions[neigh_idx]
+    def all_pairs(self, half_shell=True):
+        r"""
+        Find all pairs of particles within the cutoff-radius.
 
-                periodic_distance = np.linalg.norm(0.5 * self.box_size- (p - neigh + 0.5 * self.box_size) % self.box_size)
-                if periodic_distance>=self.r or particle_id==neigh_idx: continue
-                result_idx.append(neigh_idx)
-                result_dist.append(periodic_distance)
+        Parameters
+        ----------
+        half_shell : bool, optional, default=True
+            Only visit the 13 forward neighbour cells, so every pair is checked once.
 
-        return result_idx, result_dist
+        Returns
+        -------
+        ndarray(m), int
+            Index i of every pair.
+        ndarray(m), int
+            Index j > i of every pair.
+        ndarray(m), float
+            Distance of every pair.
+        """
+        pos = self.particle_positions
+        i, j = _enumerate_cell_pairs(lambda x, y, z: self._get_particles_in_cell(self._recalc_cell_index(x, y, z)),
+                                     self.nr_cells_one_d, half_shell)
+        distances = _periodic_distances(pos[i], pos[j], self.box_size)
+        within = distances < self.r
+        return i[within], j[within], distances[within]
 
 
     def _calc_cell_index(self, i, xyz):
@@ -325,7 +582,7 @@ class NeighbouringCellLinkedListsArray(Neighbouring):
         int
             cell index of particle i
         """
-        x, y, z = (xyz[i] / self._cell_len).astype(int)
+        x, y, z = (xyz[i] / self._cell_len).astype(int) % self.nr_cells_one_d
         return self._recalc_cell_index(x,y,z)
 
 
@@ -349,3 +606,340 @@ class NeighbouringCellLinkedListsArray(Neighbouring):
 
         """
         return cell_x*1 + cell_y * self.nr_cells_one_d + cell_z * self.nr_cells_one_d**2
+
+
+class NeighbouringSortedCellLists(Neighbouring):
+    r"""
+    Cell lists built with numpy only: all particles are binned at once and sorted by
+    their cell, so every cell is a contiguous slice of the sorted particle indices.
+
+    Parameters
+    ----------
+    particle_positions : array (float)
+        Positions of all particles inside the simulation-box
+    radius : float
+        Cutoff-radius for short-range coulomb interaction.
+    box_size : int or float
+        Side-length of the simulation-box.
+    half_shell : bool, optional, default=True
+        Enumerate pairs over the cell itself and its 13 forward neighbour cells, so
+        every pair is visited once instead of twice.
+    """
+    def __init__(self, particle_positions, radius, box_size, half_shell=True):
+        super(NeighbouringSortedCellLists, self).__init__(particle_positions, radius)
+        self.box_size = float(box_size)
+        self.nr_cells = int(max(1, self.box_size/self.r))
+        self._cell_len = self.box_size / self.nr_cells
+        self.half_shell = half_shell
+        self._stencil = _full_stencil(self.nr_cells)
+
+        self.create_neighbourlist()
+
+    # private methods
+
+    def _cells_of(self, positions):
+        r"""
+        Calculates the x, y, z cell indices of positions.
+        """
+        return np.floor(positions / self._cell_len).astype(int) % self.nr_cells
+
+    def _candidates(self, cells, stencil):
+        r"""
+        Enumerates all particles in the neighbouring cells of the given cells.
+
+        Parameters
+        ----------
+        cells : ndarray(m, 3), int
+            x, y, z cell indices.
+        stencil : ndarray(s, 3), int
+            Offsets of the neighbouring cells.
+
+        Returns
+        -------
+        ndarray(k), int
+            Index into cells for every candidate.
+        ndarray(k), int
+            Particle index of every candidate.
+        """
+        shape = (self.nr_cells,) * 3
+        owners, candidates = [], []
+        for offset in stencil:
+            neighbour_cells = np.ravel_multi_index(((cells + offset) % self.nr_cells).T, shape)
+            start = self._cell_start[neighbour_cells]
+            counts = self._cell_end[neighbour_cells] - start
+            total = counts.sum()
+            # position of every candidate inside its cell slice
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            owners.append(np.repeat(np.arange(len(cells)), counts))
+            candidates.append(self._sorted_particles[np.repeat(start, counts) + within])
+        return np.concatenate(owners), np.concatenate(candidates)
+
+    # public methods
+    def create_neighbourlist(self):
+        r"""
+        Bins all particles into cells and sorts them by cell index.
+        """
+        self.n = len(self.particle_positions)
+        self._cells = self._cells_of(self.particle_positions)
+        cell_index = np.ravel_multi_index(self._cells.T, (self.nr_cells,) * 3)
+        self._sorted_particles = np.argsort(cell_index, kind='stable')
+        counts = np.bincount(cell_index, minlength=self.nr_cells**3)
+        self._cell_end = np.cumsum(counts)
+        self._cell_start = self._cell_end - counts
+        self._neighbourlist = self._sorted_particles
+
+    def update_neighbourlist(self, xyz):
+        r"""
+        Updates the neighbour-list.
+
+        Parameters
+        ----------
+        xyz : ndarray(n,3), float
+            Position of n particles in x,y,z coordinates.
+        """
+        self.particle_positions = xyz
+        self.create_neighbourlist()
+
+    def all_pairs(self):
+        r"""
+        Find all pairs of particles within the cutoff-radius.
+
+        Returns
+        -------
+        ndarray(m), int
+            Index i of every pair.
+        ndarray(m), int
+            Index j > i of every pair.
+        ndarray(m), float
+            Distance of every pair.
+        """
+        pos = self.particle_positions
+        if self.half_shell and self.nr_cells >= 3:
+            # pairs inside a cell with j > i and all pairs with the 13 forward cells
+            i, j = self._candidates(self._cells, np.zeros((1, 3), dtype=int))
+            keep = i < j
+            i_forward, j_forward = self._candidates(self._cells, _HALF_SHELL)
+            i = np.concatenate((i[keep], i_forward))
+            j = np.concatenate((j[keep], j_forward))
+            i, j = np.minimum(i, j), np.maximum(i, j)
+        else:
+            i, j = self._candidates(self._cells, self._stencil)
+            keep = i < j
+            i, j = i[keep], j[keep]
+        distances = _periodic_distances(pos[i], pos[j], self.box_size)
+        within = distances < self.r
+        return i[within], j[within], distances[within]
+
+    def get_particles_within_radius(self, particle_id):
+        r"""
+        Find all neighbouring particles within the cutoff-radius and calculate their distances.
+
+        Parameters
+        ----------
+        particle_id : int
+            Particle-index
+
+        Returns
+        -------
+        ret_idx : list (int)
+            Indices of all neighbouring particles within the cutoff-radius.
+        ret_dist : list (float)
+            Distances from one particle to all neighbouring particles within the cutoff-radius.
+        """
+        pos = self.particle_positions
+        _, candidates = self._candidates(self._cells[[particle_id]], self._stencil)
+        candidates = candidates[candidates != particle_id]
+        distances = _periodic_distances(pos[[particle_id]], pos[candidates], self.box_size)
+        within = distances < self.r
+        return candidates[within].tolist(), distances[within].tolist()
+
+
+class NeighbouringVerletLists(Neighbouring):
+    r"""
+    Verlet lists: all pairs within radius + skin are stored and only rebuilt when a particle
+    moved further than skin / 2 since the last build. In between, only the distances of the
+    stored pairs are recalculated.
+
+    Parameters
+    ----------
+    particle_positions : array (float)
+        Positions of all particles inside the simulation-box
+    radius : float
+        Cutoff-radius for short-range coulomb interaction.
+    box_size : int or float
+        Side-length of the simulation-box.
+    skin : float
+        Additional distance of the stored pairs.
+    """
+    def __init__(self, particle_positions, radius, box_size, skin):
+        super(NeighbouringVerletLists, self).__init__(particle_positions, radius)
+        if skin < 0:
+            raise ValueError('skin must not be negative')
+        self.box_size = float(box_size)
+        self.skin = float(skin)
+        self.rebuilds = 0
+        self._cell_lists = NeighbouringSortedCellLists(particle_positions, self.r + self.skin, self.box_size)
+
+        self.create_neighbourlist()
+
+    # public methods
+    def create_neighbourlist(self):
+        r"""
+        Stores all pairs within radius + skin of the current positions.
+        """
+        self.n = len(self.particle_positions)
+        self._cell_lists.update_neighbourlist(self.particle_positions)
+        self._pair_i, self._pair_j, _ = self._cell_lists.all_pairs()
+        self._reference_positions = np.array(self.particle_positions, copy=True)
+        self._neighbourlist = (self._pair_i, self._pair_j)
+        self.rebuilds += 1
+
+    def max_displacement(self):
+        r"""
+        Largest distance a particle moved since the last build.
+
+        Returns
+        -------
+        float
+        """
+        return _periodic_distances(self.particle_positions, self._reference_positions, self.box_size).max()
+
+    def update_neighbourlist(self, xyz):
+        r"""
+        Updates the positions and rebuilds the neighbour-list if a particle moved further than skin / 2.
+
+        Parameters
+        ----------
+        xyz : ndarray(n,3), float
+            Position of n particles in x,y,z coordinates.
+        """
+        self.particle_positions = xyz
+        if len(xyz) != self.n or self.max_displacement() > self.skin / 2:
+            self.create_neighbourlist()
+
+    def all_pairs(self):
+        r"""
+        Find all pairs of particles within the cutoff-radius among the stored pairs.
+
+        Returns
+        -------
+        ndarray(m), int
+            Index i of every pair.
+        ndarray(m), int
+            Index j > i of every pair.
+        ndarray(m), float
+            Distance of every pair.
+        """
+        pos = self.particle_positions
+        distances = _periodic_distances(pos[self._pair_i], pos[self._pair_j], self.box_size)
+        within = distances < self.r
+        return self._pair_i[within], self._pair_j[within], distances[within]
+
+    def get_particles_within_radius(self, particle_id):
+        r"""
+        Find all neighbouring particles within the cutoff-radius and calculate their distances.
+
+        Parameters
+        ----------
+        particle_id : int
+            Particle-index
+
+        Returns
+        -------
+        ret_idx : list (int)
+            Indices of all neighbouring particles within the cutoff-radius.
+        ret_dist : list (float)
+            Distances from one particle to all neighbouring particles within the cutoff-radius.
+        """
+        i, j, distances = self.all_pairs()
+        first, second = i == particle_id, j == particle_id
+        return np.concatenate((j[first], i[second])).tolist(), \
+               np.concatenate((distances[first], distances[second])).tolist()
+
+
+class NeighbouringKDTree(Neighbouring):
+    r"""
+    Periodic KD-tree from scipy. Unlike cell lists the tree adapts to the particle density,
+    so it stays balanced for inhomogeneous or clustered systems.
+
+    Parameters
+    ----------
+    particle_positions : array (float)
+        Positions of all particles inside the simulation-box
+    radius : float
+        Cutoff-radius for short-range coulomb interaction.
+    box_size : int or float
+        Side-length of the simulation-box.
+    """
+    def __init__(self, particle_positions, radius, box_size):
+        super(NeighbouringKDTree, self).__init__(particle_positions, radius)
+        self.box_size = float(box_size)
+
+        self.create_neighbourlist()
+
+    # public methods
+    def create_neighbourlist(self):
+        r"""
+        Builds the periodic KD-tree.
+        """
+        self.n = len(self.particle_positions)
+        positions = np.mod(self.particle_positions, self.box_size)
+        # rounding of the modulo can give exactly box_size, which is outside of the periodic tree
+        positions[positions >= self.box_size] = 0.
+        self._neighbourlist = cKDTree(positions, boxsize=self.box_size)
+
+    def update_neighbourlist(self, xyz):
+        r"""
+        Updates the neighbour-list.
+
+        Parameters
+        ----------
+        xyz : ndarray(n,3), float
+            Position of n particles in x,y,z coordinates.
+        """
+        self.particle_positions = xyz
+        self.create_neighbourlist()
+
+    def all_pairs(self):
+        r"""
+        Find all pairs of particles within the cutoff-radius.
+
+        Returns
+        -------
+        ndarray(m), int
+            Index i of every pair.
+        ndarray(m), int
+            Index j > i of every pair.
+        ndarray(m), float
+            Distance of every pair.
+        """
+        pos = self.particle_positions
+        pairs = self._neighbourlist.query_pairs(self.r, output_type='ndarray')
+        i, j = pairs[:, 0], pairs[:, 1]
+        distances = _periodic_distances(pos[i], pos[j], self.box_size)
+        within = distances < self.r
+        return i[within], j[within], distances[within]
+
+    def get_particles_within_radius(self, particle_id):
+        r"""
+        Find all neighbouring particles within the cutoff-radius and calculate their distances.
+
+        Parameters
+        ----------
+        particle_id : int
+            Particle-index
+
+        Returns
+        -------
+        ret_idx : list (int)
+            Indices of all neighbouring particles within the cutoff-radius.
+        ret_dist : list (float)
+            Distances from one particle to all neighbouring particles within the cutoff-radius.
+        """
+        pos = self.particle_positions
+        candidates = np.array(self._neighbourlist.query_ball_point(self._neighbourlist.data[particle_id], self.r),
+                              dtype=int)
+        candidates = candidates[candidates != particle_id]
+        distances = _periodic_distances(pos[[particle_id]], pos[candidates], self.box_size)
+        within = distances < self.r
+        return candidates[within].tolist(), distances[within].tolist()
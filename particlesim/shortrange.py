@@ -16,11 +16,15 @@
 #
 
 import numpy as np
-from particlesim.k_cython import fast_distances
+from particlesim.k_cython import fast_pair_distances, fast_shortrange_energy, \
+    fast_shortrange_energy_parallel, fast_shortrange_energy_batch
 from scipy.special import erfc
-from particlesim.neighbouring import NeighbouringCellLinkedLists
+from particlesim.neighbouring import NeighbouringSortedCellLists, NeighbouringVerletLists, NeighbouringKDTree, \
+    NeighbouringCellLinkedListsArray
 from particlesim.utils.conversion import prefactor
 
+# Default number of particle pairs per block of the streamed numpy kernel, about 8 MB per pair array
+_PAIRS_PER_BLOCK = 2 ** 20
 
 class Shortrange(object):
     r"""
@@ -39,18 +43,24 @@ class Shortrange(object):
         self.epsilon_r = system_conf.epsilon_r
         self.box_length = system_conf.box_size
         self.charges = system_conf.charges
-        self.epsilons = system_conf.lj_epsilon_matrix
-        self.sigmas = system_conf.lj_sigma_matrix
+        # Lennard-Jones parameters as type tables, the pair parameters are table[types[i], types[j]]
+        self.types = system_conf.lj_type_ids
+        self.epsilon_table = system_conf.lj_epsilon_table
+        self.sigma_table = system_conf.lj_sigma_table
+        self.lj_cutoff_table = system_conf.lj_cutoff_table
         self.sigma_c = sigma_c
-        self.distances = np.zeros((system_conf.xyz.shape[0],system_conf.xyz.shape[0]))
+        self.kernel = system_conf.shortrange_kernel
+        self.num_threads = system_conf.num_threads
+        self.block_size = system_conf.block_size
         self.r_cutoff = r_cutoff
         self.neighbouring = system_conf.neighbouring
-
+        # State of single particle moves
+        self._move_list = None
+        self._trial_move = None
 
         # Create instance of neighbouring list
-        if(self.neighbouring):
-            self.nlist = NeighbouringCellLinkedLists(system_conf.xyz, r_cutoff,
-                                                    self.box_length)
+        self.nlist = None
+        self.recreate_neighbourlist()
 
     def lj_potential(self, r, sigma=1.0, epsilon=1.0):
         r"""
@@ -100,59 +110,329 @@ class Shortrange(object):
         [n, m] = positions.shape
 
 
+        if self.neighbouring:
+            if self.nlist is None:
+                self.recreate_neighbourlist()
+            self.nlist.update_neighbourlist(positions)
+            i, j, distances = self.nlist.all_pairs()
+
+            return self._pair_energy(distances, *self._lj_parameters(i, j), self.charges[i] * self.charges[j],
+                                     coulomb=coulomb, lj=lj)
+
+        elif self.kernel == "cython":
+            arguments = (np.ascontiguousarray(positions, dtype=np.float64), self.charges, self.types,
+                         self.sigma_table, self.epsilon_table, self.lj_cutoff_table, self.r_cutoff, self.sigma_c,
+                         self.box_length)
+            if self.num_threads > 1:
+                lj_interaction, coulomb_interaction = fast_shortrange_energy_parallel(
+                    *arguments, lj=lj, coulomb=coulomb, num_threads=self.num_threads)
+            else:
+                lj_interaction, coulomb_interaction = fast_shortrange_energy(*arguments, lj=lj, coulomb=coulomb)
+            return lj_interaction + coulomb_interaction * 1/(4*np.pi) * prefactor
+
+        else:
+            # Stream over blocks of rows of the upper triangle, so no n x n distance matrix is stored
+            block_size = self.block_size or max(1, _PAIRS_PER_BLOCK // n)
+            energy = 0
+            for start in range(0, n - 1, block_size):
+                stop = min(start + block_size, n - 1)
+                i, j = self._pair_block(n, start, stop)
+                distances = np.empty(len(i))
+                fast_pair_distances(positions, start, stop, self.box_length, distances, num_threads=self.num_threads)
+                energy += self._pair_energy(distances, *self._lj_parameters(i, j), self.charges[i] * self.charges[j],
+                                            coulomb=coulomb, lj=lj)
+            return energy
+
+    def shortrange_batch(self, positions, coulomb=True, lj=True):
+        r"""
+        Compute the shortrange energy of several configurations. With the "cython" kernel all
+        configurations are evaluated in one call of the compiled kernel, which loops over the
+        particle pairs once and evaluates every pair for all configurations.
+
+        Parameters
+        ----------
+        positions : numpy.ndarray(shape=(b, n, d))
+            d-dimensional coordinates of n particles for b configurations.
+        coulomb : bool
+            If true calculate coulomb potential.
+        lj : bool
+            If true calculate lennard jones potential.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(b,))
+            Total interaction potential of every configuration in Hartree-Energy.
+        """
+        if self.neighbouring or self.kernel != "cython":
+            return np.array([self.shortrange(frame, coulomb=coulomb, lj=lj) for frame in positions])
+
+        lj_energies = np.zeros(len(positions))
+        coulomb_energies = np.zeros(len(positions))
+        # The kernel loops over the configurations innermost and expects the positions inside the box
+        positions = np.mod(np.asarray(positions, dtype=np.float64), self.box_length)
+        fast_shortrange_energy_batch(np.ascontiguousarray(positions.transpose(1, 2, 0)), self.charges, self.types,
+                                     self.sigma_table, self.epsilon_table, self.lj_cutoff_table, self.r_cutoff,
+                                     self.sigma_c, self.box_length, lj_energies, coulomb_energies,
+                                     lj=lj, coulomb=coulomb, num_threads=self.num_threads)
+        return lj_energies + coulomb_energies * 1/(4*np.pi) * prefactor
+
+    def _pair_energy(self, distances, sigmas, epsilons, lj_cutoffs, charge_products, coulomb=True, lj=True):
+        r"""
+        Compute the shortrange energy of a set of particle pairs, every pair is counted once.
+
+        Parameters
+        ----------
+        distances : numpy.ndarray(shape=(m,))
+            Distance of every pair.
+        sigmas : numpy.ndarray(shape=(m,))
+            Lennard-Jones sigma of every pair.
+        epsilons : numpy.ndarray(shape=(m,))
+            Lennard-Jones epsilon of every pair.
+        lj_cutoffs : numpy.ndarray(shape=(m,))
+            Lennard-Jones cutoff of every pair.
+        charge_products : numpy.ndarray(shape=(m,))
+            Product of the charges of every pair.
+        coulomb : bool
+            If true calculate coulomb potential.
+        lj : bool
+            If true calculate lennard jones potential.
+
+        Returns
+        -------
+        float
+            Interaction potential in Hartree-Energy.
+        """
         lj_interaction = 0
         coulomb_interaction = 0
 
-        #self.nlist.update_cells(positions)
+        if lj:
+            mask = distances < lj_cutoffs
+            lj_interaction = self.lj_potential(distances[mask], sigma=sigmas[mask], epsilon=epsilons[mask])
+        if coulomb:
+            mask = distances < self.r_cutoff
+            pair_distances = distances[mask]
+            coulomb_interaction = np.sum(charge_products[mask] / pair_distances *
+                                         erfc(pair_distances / (np.sqrt(2) * self.sigma_c)))
 
+        return lj_interaction + coulomb_interaction * 1/(4*np.pi) * prefactor
+
+    def particle_energies(self, positions, coulomb=True, lj=True):
+        r"""
+        Compute the shortrange energy of every particle with all its neighbours from the
+        compressed sparse row neighbour-list. Every pair energy is contained in the energies
+        of both particles, so the total shortrange energy is half of the sum.
+
+        Parameters
+        ----------
+        positions : numpy.ndarray(shape=(n, d))
+            d-dimensional coordinates of n particles.
+        coulomb : bool
+            If true calculate coulomb potential.
+        lj : bool
+            If true calculate lennard jones potential.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(n,))
+            Interaction energy of every particle in Hartree-Energy.
+        """
         if self.neighbouring:
-            self.nlist.particle_positions = positions
-            self.nlist.create_neighbourlist()
+            if self.nlist is None:
+                self.recreate_neighbourlist()
+            nlist = self.nlist
+            nlist.update_neighbourlist(positions)
+        else:
+            nlist = NeighbouringSortedCellLists(positions, self._neighbour_radius(), self.box_length)
+        offsets, indices, distances = nlist.csr_neighbourlist()
+        rows = np.repeat(np.arange(len(positions)), np.diff(offsets))
+
+        pair_energies = np.zeros(len(indices))
+        if lj:
+            sigmas, epsilons, lj_cutoffs = self._lj_parameters(rows, indices)
+            mask = distances < lj_cutoffs
+            q = (sigmas[mask] / distances[mask]) ** 6
+            pair_energies[mask] += 4.0 * epsilons[mask] * q * (q - 1.0)
+        if coulomb:
+            mask = distances < self.r_cutoff
+            pair_distances = distances[mask]
+            pair_energies[mask] += self.charges[rows[mask]] * self.charges[indices[mask]] / pair_distances * \
+                                   erfc(pair_distances / (np.sqrt(2) * self.sigma_c)) * 1/(4*np.pi) * prefactor
+
+        energies = np.zeros(len(positions))
+        has_neighbours = offsets[:-1] < offsets[1:]
+        if np.any(has_neighbours):
+            energies[has_neighbours] = np.add.reduceat(pair_energies, offsets[:-1][has_neighbours])
+        return energies
+
+
+    def _pair_block(self, n, start, stop):
+        r"""
+        Indices of all particle pairs i < j with start <= i < stop, in the order of fast_pair_distances.
 
+        Parameters
+        ----------
+        n : int
+            Number of particles.
+        start : int
+            First row of the block.
+        stop : int
+            End of the block, exclusive.
+
+        Returns
+        -------
+        i : numpy.ndarray(shape=(m,))
+        j : numpy.ndarray(shape=(m,))
+        """
+        rows = np.arange(start, stop)
+        counts = n - 1 - rows
+        i = np.repeat(rows, counts)
+        j = np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts) + i + 1
+        return i, j
 
-            for particle1 in range(0, n):
+    def _lj_parameters(self, i, j):
+        r"""
+        Look up the Lennard-Jones parameters of particle pairs in the type tables.
 
-                neighbors, neigh_dists = self.nlist.get_particles_within_radius(particle1)
-                if len(neighbors) == 0:
-                    continue
-                neighbors = np.array(neighbors)
+        Parameters
+        ----------
+        i : numpy.ndarray(shape=(m,)) or int
+            Indices of the first particles.
+        j : numpy.ndarray(shape=(m,))
+            Indices or boolean mask of the second particles.
 
-                neigh_dists = np.array(neigh_dists)
-                sigma = self.sigmas[[particle1], [neighbors]]
-                epsilon = self.epsilons[[particle1], [neighbors]]
-                charges = self.charges
-                if coulomb:
-                    coulomb_interaction += charges[particle1] * np.sum(charges[neighbors]/neigh_dists * erfc(neigh_dists/(np.sqrt(2) * self.sigma_c)))
+        Returns
+        -------
+        sigmas : numpy.ndarray(shape=(m,))
+        epsilons : numpy.ndarray(shape=(m,))
+        lj_cutoffs : numpy.ndarray(shape=(m,))
+        """
+        type_i = self.types[i]
+        type_j = self.types[j]
+        return (self.sigma_table[type_i, type_j], self.epsilon_table[type_i, type_j],
+                self.lj_cutoff_table[type_i, type_j])
 
-                if lj:
-                    lj_interaction += self.lj_potential(neigh_dists, sigma=sigma, epsilon=epsilon)
+    def _particle_energy(self, positions, index, position, coulomb=True, lj=True):
+        r"""
+        Compute the interaction energy of one particle at a given position with all other particles.
 
-            return 0.5 * (lj_interaction + coulomb_interaction * 1/(4*np.pi) * prefactor)
+        Parameters
+        ----------
+        positions : numpy.ndarray(shape=(n, d))
+            d-dimensional coordinates of n particles.
+        index : int
+            Index of the particle.
+        position : numpy.ndarray(shape=(d,))
+            Position of the particle; positions[index] is ignored.
+        coulomb : bool
+            If true calculate coulomb potential.
+        lj : bool
+            If true calculate lennard jones potential.
 
+        Returns
+        -------
+        float
+            Interaction energy of the particle in Hartree-Energy.
+        """
+        if self.neighbouring and self._move_list is not None:
+            # Only the particles in the neighbouring cells, O(1) instead of O(n)
+            others, distances = self._move_list.query_position(position, exclude=index)
         else:
-            fast_distances(positions, box_len=self.box_length, distances=self.distances)
-            for particle1 in range(0,n):
-                lj_interaction_tmp, coulomb_interaction_tmp = 0,0
-                for particle2 in range(particle1+1, n):
-                    if lj:
-                        sigma = self.sigmas[particle1, particle2]
-                        epsilon = self.epsilons[particle1, particle2]
-                        cutoff = self.system_conf.lj_cutoff_matrix[particle1, particle2]
-                        distance = self.distances[particle1,particle2]
-
-                        if distance < cutoff:
-                            lj_interaction_tmp += self.lj_potential(distance,sigma,epsilon)
-                    if coulomb:
-                        cutoff = self.r_cutoff
-                        distance = self.distances[particle1,particle2]
-
-                        if distance < cutoff:
-                            coulomb_interaction_tmp += self.charges[particle1] * self.charges[particle2] / distance * erfc(
-                                distance / (np.sqrt(2) * self.sigma_c))
-
-                lj_interaction +=  lj_interaction_tmp
-                coulomb_interaction += coulomb_interaction_tmp
-            return lj_interaction + coulomb_interaction * 1/(4*np.pi) * prefactor
+            box_half = self.box_length / 2
+            others = np.arange(len(positions)) != index
+            distances = np.linalg.norm(box_half - (position - positions[others] + box_half) % self.box_length, axis=1)
+
+        lj_interaction = 0
+        coulomb_interaction = 0
+
+        if lj:
+            sigmas, epsilons, lj_cutoffs = self._lj_parameters(index, others)
+            mask = distances < lj_cutoffs
+            lj_interaction = self.lj_potential(distances[mask], sigma=sigmas[mask], epsilon=epsilons[mask])
+        if coulomb:
+            mask = distances < self.r_cutoff
+            neigh_dists = distances[mask]
+            coulomb_interaction = self.charges[index] * np.sum(self.charges[others][mask] / neigh_dists *
+                                                               erfc(neigh_dists / (np.sqrt(2) * self.sigma_c)))
+
+        return lj_interaction + coulomb_interaction * 1/(4*np.pi) * prefactor
+
+    def shortrange_delta(self, positions, index, new_position, coulomb=True, lj=True):
+        r"""
+        Compute the change of the shortrange energy if a single particle is moved. Only
+        the pair terms of the moved particle are evaluated, so the costs are O(n), or O(1)
+        with neighbouring.
+
+        Parameters
+        ----------
+        positions : numpy.ndarray(shape=(n, d))
+            d-dimensional coordinates of n particles before the move.
+        index : int
+            Index of the moved particle.
+        new_position : numpy.ndarray(shape=(d,))
+            Trial position of the moved particle.
+        coulomb : bool
+            If true calculate coulomb potential.
+        lj : bool
+            If true calculate lennard jones potential.
+
+        Returns
+        -------
+        float
+            Difference of the shortrange energy in Hartree-Energy.
+        """
+        self._trial_move = index, new_position
+        return self._particle_energy(positions, index, new_position, coulomb=coulomb, lj=lj) - \
+               self._particle_energy(positions, index, positions[index], coulomb=coulomb, lj=lj)
+
+    def init_incremental(self, positions):
+        r"""
+        Prepares single particle moves starting from an accepted configuration. With neighbouring,
+        a linked cell list is created that is updated particle by particle in commit.
+
+        Parameters
+        ----------
+        positions : numpy.ndarray(shape=(n, d))
+            Accepted configuration.
+        """
+        self._trial_move = None
+        self._move_list = None
+        if self.neighbouring:
+            radius = self._neighbour_radius()
+            self._move_list = NeighbouringCellLinkedListsArray(positions, self.box_length, radius)
+
+    def commit(self):
+        r"""
+        Accepts the trial move of the last shortrange_delta call.
+        """
+        if self._trial_move is not None and self._move_list is not None:
+            self._move_list.move_particle(*self._trial_move)
+        self._trial_move = None
+
+    def rollback(self):
+        r"""
+        Rejects the trial move of the last shortrange_delta call.
+        """
+        self._trial_move = None
+
+    def get_incremental_state(self):
+        r"""
+        Returns
+        -------
+        NeighbouringCellLinkedListsArray or None
+            Linked cell list of the accepted configuration, can be passed to set_incremental_state.
+            It is updated in place by the following commits.
+        """
+        return self._move_list
+
+    def set_incremental_state(self, state):
+        r"""
+        Parameters
+        ----------
+        state : NeighbouringCellLinkedListsArray or None
+            Linked cell list returned by get_incremental_state.
+        """
+        self._move_list = state
+        self._trial_move = None
 
 
     def get_iterations(self):
@@ -164,19 +444,27 @@ class Shortrange(object):
             Total number of iterations to calculate the short-range potential.
         """
         if self.neighbouring:
-            it = 0
-            for particle1 in range(0, len(self.charges)):
-                neighbors, neigh_dists = self.nlist.get_particles_within_radius(particle1)
-                it += len(neighbors)
-            return it
+            if self.nlist is None:
+                self.recreate_neighbourlist()
+            return len(self.nlist.all_pairs()[0])
         else:
             return len(self.charges)*(len(self.charges)-1)/2
 
 
+    def _neighbour_radius(self):
+        # Pairs beyond r_cutoff still interact if they are within the Lennard-Jones cutoff
+        return max(self.r_cutoff, self.lj_cutoff_table.max())
+
     def recreate_neighbourlist(self):
         '''
         Necessary for time measurement to estimate cutoff parameters.
         '''
         if self.neighbouring:
-            self.nlist = NeighbouringCellLinkedLists(self.system_conf.xyz, self.r_cutoff,
-                                                 self.box_length)
\ No newline at end of file
+            radius = self._neighbour_radius()
+            if self.system_conf.neighbouring_method == "kdtree":
+                self.nlist = NeighbouringKDTree(self.system_conf.xyz, radius, self.box_length)
+            elif self.system_conf.neighbouring_method == "verlet":
+                self.nlist = NeighbouringVerletLists(self.system_conf.xyz, radius, self.box_length,
+                                                     self.system_conf.skin)
+            else:
+                self.nlist = NeighbouringSortedCellLists(self.system_conf.xyz, radius, self.box_length)
\ No newline at end of file
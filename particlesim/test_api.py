@@ -86,5 +86,46 @@ def test_create_lennard_jones_sigmas():
     system_configuration = SystemConfiguration(xyz=particle_positions, charges=charges, epsilons=epsilons, sigmas=sigmas)
     np.testing.assert_array_equal(sigmas, system_configuration.lj_sigma_matrix.diagonal())
 
+def test_lennard_jones_type_tables():
+    particle_positions = np.random.rand(6, 3)
+    sigmas = [2, 1.5, 2, 1, 1.5, 2]
+    epsilons = [1, 1, 1, 0.5, 1, 2]
+    system_configuration = SystemConfiguration(xyz=particle_positions, epsilons=epsilons, sigmas=sigmas)
+    assert system_configuration.lj_sigma_table.shape == (4, 4)
+    assert system_configuration.lj_type_ids[0] == system_configuration.lj_type_ids[2]
+    sigma_matrix = (np.array(sigmas)[:, np.newaxis] + np.array(sigmas)) / 2
+    epsilon_matrix = np.sqrt(np.array(epsilons)[:, np.newaxis] * np.array(epsilons))
+    np.testing.assert_allclose(system_configuration.lj_sigma_matrix, sigma_matrix)
+    np.testing.assert_allclose(system_configuration.lj_epsilon_matrix, epsilon_matrix)
+    np.testing.assert_allclose(system_configuration.lj_cutoff_matrix, 2.5 * sigma_matrix)
+
+def test_unknown_longrange_method():
+    particle_positions = np.random.rand(3, 3)
+    with pytest.raises(ValueError):
+        SystemConfiguration(xyz=particle_positions, longrange_method="pppm")
+
+def test_num_threads():
+    particle_positions = np.random.rand(3, 3)
+    system_configuration = SystemConfiguration(xyz=particle_positions, num_threads=2)
+    assert system_configuration._total_potential.shortrange.num_threads == 2
+    with pytest.raises(ValueError):
+        system_configuration.num_threads = 0
+
 def test_only_input_positions_within_box_are_excepted():
-    pass
\ No newline at end of file
+    pass
+
+
+def test_potential_batch():
+    box_size = 12.
+    xyz = np.random.rand(6, 20, 3) * box_size
+    charges = [1., -1.] * 10
+    for longrange_method in ["ewald", "spme"]:
+        system_configuration = SystemConfiguration(xyz=xyz[0], charges=charges, box_size=box_size, r_cutoff=4.,
+                                                   k_cutoff=3., longrange_method=longrange_method)
+        for shortrange_kernel in ["cython", "numpy"]:
+            system_configuration.shortrange_kernel = shortrange_kernel
+            reference = [system_configuration.potential(frame, lennard_jones=True, coulomb=True) for frame in xyz]
+            np.testing.assert_allclose(system_configuration.potential_batch(xyz, chunk_size=4), reference,
+                                       rtol=1e-8)
+    with pytest.raises(ValueError):
+        system_configuration.potential_batch(xyz[:, :10])
@@ -44,4 +44,116 @@ def test_equivalence_CLL_PL():
     particle_pos = np.random.rand(nr_particles, 3)*box_size
     NL_PL = NeighbouringPrimitiveLists(particle_pos, radius=1.2, box_size=box_size)
     NL_CLL = NeighbouringCellLinkedLists(particle_pos, radius=1.2, box_size=box_size)
-    assert set(NL_CLL.get_particles_within_radius(pid)[0]) == set(NL_PL.get_particles_within_radius(pid))
\ No newline at end of file
+    assert set(NL_CLL.get_particles_within_radius(pid)[0]) == set(NL_PL.get_particles_within_radius(pid))
+
+def test_sorted_cell_lists_all_pairs():
+    box_size = 7.6
+    radius = 1.2
+    nr_particles = 60
+    particle_pos = np.random.rand(nr_particles, 3) * box_size
+    NL_PL = NeighbouringPrimitiveLists(particle_pos, radius=radius, box_size=box_size)
+    NL_SCL = NeighbouringSortedCellLists(particle_pos, radius=radius, box_size=box_size)
+    i, j, dist = NL_SCL.all_pairs()
+    assert np.all(i < j)
+    pairs = set(zip(i.tolist(), j.tolist()))
+    assert len(pairs) == len(i)
+    reference = set((p, q) for p in range(nr_particles) for q in NL_PL.get_particles_within_radius(p) if p < q)
+    assert pairs == reference
+    for p, q, d in zip(i, j, dist):
+        np.testing.assert_almost_equal(d, periodic_distance(particle_pos[p], particle_pos[q], box_size))
+    assert set(NL_SCL.get_particles_within_radius(5)[0]) == set(NL_PL.get_particles_within_radius(5))
+
+def test_sorted_cell_lists_few_cells():
+    # Less than three cells per dimension must not lead to pairs counted twice
+    box_size = 3.0
+    particle_pos = np.random.rand(30, 3) * box_size
+    NL_PL = NeighbouringPrimitiveLists(particle_pos, radius=1.4, box_size=box_size)
+    NL_SCL = NeighbouringSortedCellLists(particle_pos, radius=1.4, box_size=box_size)
+    i, j, dist = NL_SCL.all_pairs()
+    assert len(i) == sum(len(NL_PL.get_particles_within_radius(p)) for p in range(30)) // 2
+
+
+def test_verlet_lists_rebuild_only_after_large_displacements():
+    box_size = 10.
+    radius = 2.
+    particle_pos = np.random.rand(80, 3) * box_size
+    NL_V = NeighbouringVerletLists(particle_pos, radius=radius, box_size=box_size, skin=0.6)
+    NL_SCL = NeighbouringSortedCellLists(particle_pos, radius=radius, box_size=box_size)
+    for step in range(10):
+        particle_pos = (particle_pos + 0.02 * (np.random.rand(80, 3) - 0.5)) % box_size
+        NL_V.update_neighbourlist(particle_pos)
+        NL_SCL.update_neighbourlist(particle_pos)
+        i, j, dist = NL_V.all_pairs()
+        i_ref, j_ref, dist_ref = NL_SCL.all_pairs()
+        assert set(zip(i.tolist(), j.tolist())) == set(zip(i_ref.tolist(), j_ref.tolist()))
+    assert NL_V.rebuilds == 1
+    NL_V.update_neighbourlist((particle_pos + 0.5) % box_size)
+    assert NL_V.rebuilds == 2
+
+
+def test_kdtree_equivalent_to_cell_lists():
+    box_size = 7.6
+    particle_pos = np.random.rand(60, 3) * box_size
+    NL_KD = NeighbouringKDTree(particle_pos, radius=1.2, box_size=box_size)
+    NL_SCL = NeighbouringSortedCellLists(particle_pos, radius=1.2, box_size=box_size)
+    i, j, dist = NL_KD.all_pairs()
+    i_ref, j_ref, dist_ref = NL_SCL.all_pairs()
+    assert sorted(zip(i.tolist(), j.tolist())) == sorted(zip(i_ref.tolist(), j_ref.tolist()))
+    assert set(NL_KD.get_particles_within_radius(5)[0]) == set(NL_SCL.get_particles_within_radius(5)[0])
+
+
+def test_cell_linked_lists_array_move_particle():
+    box_size = 10.
+    radius = 2.
+    particle_pos = np.random.rand(50, 3) * box_size
+    NL_A = NeighbouringCellLinkedListsArray(particle_pos, box_size=box_size, radius=radius)
+    for step in range(20):
+        i = np.random.randint(50)
+        new_pos = np.random.rand(3) * box_size
+        # a trial position can be checked without changing the list
+        idx, dist = NL_A.query_position(new_pos, exclude=i)
+        assert i not in idx
+        NL_A.move_particle(i, new_pos)
+        particle_pos[i] = new_pos
+    NL_PL = NeighbouringPrimitiveLists(particle_pos, radius=radius, box_size=box_size)
+    for i in range(50):
+        assert set(NL_A.get_particles_within_radius(i)[0]) == set(NL_PL.get_particles_within_radius(i))
+    # every particle is linked in exactly one cell
+    assert sorted(sum((NL_A._get_particles_in_cell(c) for c in range(NL_A.nr_cells)), [])) == list(range(50))
+
+
+def test_half_shell_pairs():
+    for box_size, radius in [(10., 2.), (10., 1.), (3., 1.4)]:
+        particle_pos = np.random.rand(80, 3) * box_size
+        NL_PL = NeighbouringPrimitiveLists(particle_pos, radius=radius, box_size=box_size)
+        reference = sorted((p, q) for p in range(80) for q in NL_PL.get_particles_within_radius(p) if p < q)
+        neighbour_lists = [NeighbouringCellLinkedLists(particle_pos, radius=radius, box_size=box_size),
+                           NeighbouringCellLinkedListsArray(particle_pos, box_size=box_size, radius=radius)]
+        for neighbour_list in neighbour_lists:
+            for half_shell in [True, False]:
+                i, j, dist = neighbour_list.all_pairs(half_shell=half_shell)
+                assert sorted(zip(i.tolist(), j.tolist())) == reference
+        for half_shell in [True, False]:
+            NL_SCL = NeighbouringSortedCellLists(particle_pos, radius=radius, box_size=box_size, half_shell=half_shell)
+            i, j, dist = NL_SCL.all_pairs()
+            assert sorted(zip(i.tolist(), j.tolist())) == reference
+
+
+def test_csr_neighbourlist():
+    box_size = 7.6
+    particle_pos = np.random.rand(60, 3) * box_size
+    for neighbour_list in [NeighbouringSortedCellLists(particle_pos, radius=1.5, box_size=box_size),
+                           NeighbouringKDTree(particle_pos, radius=1.5, box_size=box_size)]:
+        offsets, indices, distances, vectors = neighbour_list.csr_neighbourlist(displacements=True)
+        assert len(offsets) == 61 and offsets[-1] == len(indices)
+        for p in range(60):
+            neighbours = indices[offsets[p]:offsets[p + 1]]
+            reference = neighbour_list.get_particles_within_radius(p)[0]
+            assert sorted(neighbours.tolist()) == sorted(reference)
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), distances)
+    # the brute force lists give the same neighbours
+    primitive_list = NeighbouringPrimitiveLists(particle_pos, radius=1.5, box_size=box_size)
+    offsets, indices, distances = primitive_list.csr_neighbourlist()
+    for p in range(60):
+        neighbours = indices[offsets[p]:offsets[p + 1]]
+        assert sorted(neighbours.tolist()) == sorted(primitive_list.get_particles_within_radius(p))
@@ -20,6 +20,7 @@ from .helpers_for_tests import *
 import numpy as np
 import pytest
 from particlesim.utils.xyz import export_trajectory
+from particlesim.utils.trajectory import load_chunked_trajectory
 
 def test_all_sampled_particles_are_inside_box():
     n_particle = 4
@@ -99,4 +100,204 @@ def test_simulated_annealing():
     traj_sa, pot_sa = sampler.metropolis_sa(iteration_number=100,beta=betas)
     #labels = ['atom'] * len(traj_mc[0])
     #export_trajectory(labels, traj_mc, '/home/mark/test_mc.xyz')
-    assert len(traj_sa) == 101
\ No newline at end of file
+    assert len(traj_sa) == 101
+
+def test_single_particle_moves():
+    n_particle = 10
+    sampler, system_configuration = create_sampler(n_particle, box_size=10)
+    traj, pot = sampler.metropolis(iteration_number=50, step=0.05, move="single")
+    assert len(traj) == 51
+    # at most one particle moves per step
+    assert np.all(np.sum(np.any(traj[1:] != traj[:-1], axis=-1), axis=-1) <= 1)
+    final_pot = system_configuration.potential(traj[-1], lennard_jones=True, coulomb=True)
+    np.testing.assert_allclose(pot[-1], final_pot, rtol=1e-8, atol=1e-8)
+
+def test_unknown_move():
+    sampler, system_configuration = create_sampler(3, box_size=10)
+    with pytest.raises(ValueError):
+        sampler.metropolis(iteration_number=1, move="some")
+
+def test_single_particle_moves_with_neighbouring():
+    n_particle = 30
+    box_size = 12
+    system_configuration = create_system_configuration(n_particle, box_size=box_size, r_cutoff=3., k_cutoff=3.)
+    system_configuration.neighbouring = True
+    sampler = Sampler(system_configuration)
+    traj, pot = sampler.metropolis(iteration_number=50, step=0.05, move="single")
+    system_configuration.neighbouring = False
+    final_pot = system_configuration.potential(traj[-1], lennard_jones=True, coulomb=True)
+    np.testing.assert_allclose(pot[-1], final_pot, rtol=1e-8, atol=1e-8)
+
+def test_trajectory_sinks(tmpdir):
+    sampler, system_configuration = create_sampler(5, box_size=10)
+    traj, pot = Sampler(system_configuration, seed=3).metropolis(iteration_number=20, step=0.05)
+
+    sinks = [MemmapSink(str(tmpdir.join('traj.npy'))), ChunkedFileSink(str(tmpdir.join('traj.bin')), chunk_size=3)]
+    for sink in sinks:
+        sampler = Sampler(system_configuration, seed=3)
+        traj_sink, pot_sink = sampler.metropolis(iteration_number=20, step=0.05, sink=sink, stride=4)
+        np.testing.assert_array_equal(traj_sink, traj[::4])
+        np.testing.assert_array_equal(pot_sink, pot[::4])
+
+    frames = []
+    assert sampler.metropolis_sa(iteration_number=20, sink=CallbackSink(lambda xyz, pot: frames.append(pot)),
+                                 stride=5) is None
+    assert len(frames) == 5
+
+def test_invalid_stride():
+    sampler, system_configuration = create_sampler(3, box_size=10)
+    with pytest.raises(ValueError):
+        sampler.metropolis(iteration_number=1, stride=0)
+
+def test_run_chains():
+    sampler, system_configuration = create_sampler(5, box_size=10)
+    traj, pot = sampler.run_chains(3, iteration_number=10, step=0.05, beta=1e-6, seed=42, n_workers=2)
+    assert traj.shape == (3, 11, 5, 3) and pot.shape == (3, 11)
+    # independent chains
+    assert not np.array_equal(traj[0], traj[1])
+    # reproducible, independent of the number of workers
+    traj_again, pot_again = sampler.run_chains(3, iteration_number=10, step=0.05, beta=1e-6, seed=42,
+                                             n_workers=1)
+    np.testing.assert_array_equal(traj, traj_again)
+    np.testing.assert_array_equal(pot, pot_again)
+
+def test_workers_after_threaded_kernel():
+    # forked workers of a process that ran a multithreaded kernel used to deadlock
+    system_configuration = create_system_configuration(6, box_size=10)
+    system_configuration.num_threads = 2
+    system_configuration.potential(system_configuration.xyz, lennard_jones=True, coulomb=True)
+    traj, pot = Sampler(system_configuration).run_chains(2, iteration_number=5, n_workers=2)
+    assert traj.shape == (2, 6, 6, 3)
+    xyz, pot, acceptance = ReplicaExchangeSampler(system_configuration, [300, 600]).run(2, exchange_interval=3,
+                                                                                       n_workers=2)
+    assert xyz.shape == (2, 6, 3)
+
+def test_replica_exchange():
+    system_configuration = create_system_configuration(6, box_size=10)
+    sampler = ReplicaExchangeSampler(system_configuration, temperatures=[300, 600, 1200])
+    xyz, pot, acceptance = sampler.run(n_exchanges=6, exchange_interval=3, step=0.05, seed=1, n_workers=2)
+    assert xyz.shape == (3, 6, 3) and pot.shape == (7, 3) and acceptance.shape == (2,)
+    assert np.all((acceptance >= 0) & (acceptance <= 1))
+    np.testing.assert_array_equal(sampler.swap_attempts, [3, 3])
+    for t in range(3):
+        np.testing.assert_allclose(pot[-1, t], system_configuration.potential(xyz[t], lennard_jones=True,
+                                                                              coulomb=True), rtol=1e-8, atol=1e-8)
+    # reproducible, independent of the number of workers
+    xyz_again, pot_again, acceptance_again = sampler.run(n_exchanges=6, exchange_interval=3, step=0.05, seed=1,
+                                                         n_workers=3)
+    np.testing.assert_array_equal(xyz, xyz_again)
+    np.testing.assert_array_equal(pot, pot_again)
+
+def test_replica_exchange_single_moves():
+    system_configuration = create_system_configuration(6, box_size=10)
+    for neighbouring in [False, True]:
+        system_configuration.neighbouring = neighbouring
+        sampler = ReplicaExchangeSampler(system_configuration, temperatures=[300, 600, 1200])
+        # one worker switches between the incremental states of all replicas
+        xyz, pot, acceptance = sampler.run(n_exchanges=4, exchange_interval=5, step=0.05, move="single", seed=2,
+                                           n_workers=1)
+        xyz_again, pot_again, acceptance_again = sampler.run(n_exchanges=4, exchange_interval=5, step=0.05,
+                                                             move="single", seed=2, n_workers=3)
+        np.testing.assert_array_equal(xyz, xyz_again)
+        np.testing.assert_array_equal(pot, pot_again)
+        for t in range(3):
+            np.testing.assert_allclose(pot[-1, t], system_configuration.potential(xyz[t], lennard_jones=True,
+                                                                                  coulomb=True), rtol=1e-8, atol=1e-8)
+
+def test_replica_exchange_sinks(tmpdir):
+    system_configuration = create_system_configuration(6, box_size=10)
+    sampler = ReplicaExchangeSampler(system_configuration, temperatures=[300, 600, 1200])
+    paths = [str(tmpdir.join('temperature_%d.bin' % t)) for t in range(3)]
+    sinks = [ChunkedFileSink(path, chunk_size=2) for path in paths]
+    xyz, pot, acceptance = sampler.run(n_exchanges=6, exchange_interval=3, step=0.05, seed=1, n_workers=2,
+                                       sinks=sinks, stride=2)
+    last_pots = []
+    for t, path in enumerate(paths):
+        traj_t, pot_t = load_chunked_trajectory(path, 6)
+        assert len(traj_t) == 6 * 3 // 2 + 1
+        assert pot_t[0] == pot[0, t]
+        for frame, frame_pot in zip(np.array(traj_t), pot_t):
+            frame_reference = system_configuration.potential(frame, lennard_jones=True, coulomb=True)
+            np.testing.assert_allclose(frame_pot, frame_reference, rtol=1e-8, atol=1e-8)
+        last_pots.append(pot_t[-1])
+    # the last frames are taken before the last swap
+    np.testing.assert_array_equal(np.sort(last_pots), np.sort(pot[-1]))
+    # the sinks do not change the sampling
+    xyz_again, pot_again, acceptance_again = sampler.run(n_exchanges=6, exchange_interval=3, step=0.05, seed=1,
+                                                         n_workers=3)
+    np.testing.assert_array_equal(pot, pot_again)
+    with pytest.raises(ValueError):
+        sampler.run(n_exchanges=1, sinks=[MemorySink() for t in range(3)])
+
+def test_tune_step():
+    sampler, system_configuration = create_sampler(10, box_size=10)
+    step, acceptance = sampler.tune_step(400, step=0.5, target_acceptance=0.3, interval=50)
+    assert isinstance(step, float) and 0 < step < 0.5
+    assert acceptance.shape == (8,)
+    traj, pot = sampler.metropolis(iteration_number=5, step=step)
+    np.testing.assert_array_equal(traj[0], system_configuration.xyz)
+
+def test_tune_step_per_type():
+    box_size = 10
+    xyz = np.random.rand(10, 3) * box_size
+    system_configuration = SystemConfiguration(xyz=xyz, sigmas=[1., 0.5] * 5, box_size=box_size)
+    sampler = Sampler(system_configuration)
+    step, acceptance = sampler.tune_step(200, step=0.2, move="single", interval=20, per_type=True)
+    assert step.shape == (2,) and acceptance.shape == (10, 2)
+    traj, pot = sampler.metropolis(iteration_number=20, step=step, move="single")
+    assert len(traj) == 21
+    with pytest.raises(ValueError):
+        sampler.tune_step(10, per_type=True)
+
+def test_metropolis_ensemble():
+    sampler, system_configuration = create_sampler(6, box_size=10)
+    traj, pot = sampler.metropolis_ensemble(4, iteration_number=20, step=0.05, beta=[1e-6, 1e-6, 1., 1.], stride=5)
+    assert traj.shape == (4, 5, 6, 3) and pot.shape == (4, 5)
+    assert np.all((traj < system_configuration.box_size) * (traj >= 0))
+    np.testing.assert_array_equal(traj[:, 0], np.repeat(system_configuration.xyz[np.newaxis], 4, axis=0))
+    for c in range(4):
+        np.testing.assert_allclose(pot[c, -1], system_configuration.potential(traj[c, -1], lennard_jones=True,
+                                                                              coulomb=True), rtol=1e-8, atol=1e-8)
+
+def test_checkpoint_resume(tmpdir):
+    sampler, system_configuration = create_sampler(5, box_size=10)
+    checkpoint_path = str(tmpdir.join('checkpoint.npz'))
+    for run, move in [(Sampler.metropolis, "all"), (Sampler.metropolis, "single"), (Sampler.metropolis_sa, "all")]:
+        traj, pot = run(Sampler(system_configuration, seed=7), 30, step=0.05, move=move, stride=3,
+                        checkpoint_path=checkpoint_path, checkpoint_interval=20)
+        traj_resumed, pot_resumed = Sampler(system_configuration, seed=0).resume(checkpoint_path)
+        # the checkpoint was written after 20 steps, the stored frames after it belong to steps 21, 24, 27, 30
+        np.testing.assert_array_equal(traj_resumed, traj[-4:])
+        np.testing.assert_array_equal(pot_resumed, pot[-4:])
+    # the schedule of metropolis_sa is stored once, not in every checkpoint
+    with np.load(checkpoint_path) as data:
+        assert 'beta' not in data.files
+    assert len(np.load(checkpoint_path + '.beta.npy')) == 30
+
+def test_checkpoint_resume_file_sinks(tmpdir):
+    sampler, system_configuration = create_sampler(5, box_size=10)
+    checkpoint_path = str(tmpdir.join('checkpoint.npz'))
+    traj, pot = Sampler(system_configuration, seed=7).metropolis(30, step=0.05, stride=3)
+    for create_sink in [lambda: MemmapSink(str(tmpdir.join('traj.npy'))),
+                        lambda: ChunkedFileSink(str(tmpdir.join('traj.bin')), chunk_size=4)]:
+        Sampler(system_configuration, seed=7).metropolis(30, step=0.05, stride=3, sink=create_sink(),
+                                                         checkpoint_path=checkpoint_path, checkpoint_interval=20)
+        # the resumed run keeps the frames up to the checkpoint and replaces the ones after it
+        traj_resumed, pot_resumed = Sampler(system_configuration, seed=0).resume(checkpoint_path, sink=create_sink())
+        np.testing.assert_array_equal(traj_resumed, traj)
+        np.testing.assert_array_equal(pot_resumed, pot)
+
+def test_sampler_seed():
+    sampler, system_configuration = create_sampler(5, box_size=10)
+    traj, pot = Sampler(system_configuration, seed=11).metropolis(iteration_number=10, step=0.05, move="single")
+    traj_again, pot_again = Sampler(system_configuration, seed=11).metropolis(iteration_number=10, step=0.05,
+                                                                              move="single")
+    np.testing.assert_array_equal(traj, traj_again)
+    # samplers in one process do not share random numbers
+    other = Sampler(system_configuration, seed=11)
+    Sampler(system_configuration).metropolis(iteration_number=5)
+    np.testing.assert_array_equal(other.metropolis(iteration_number=10, step=0.05, move="single")[0], traj)
+    # chains spawned from the seed of the sampler are reproducible
+    chains = Sampler(system_configuration, seed=5).run_chains(2, iteration_number=5, n_workers=1)[0]
+    np.testing.assert_array_equal(chains, Sampler(system_configuration, seed=5).run_chains(2, iteration_number=5,
+                                                                                          n_workers=1)[0])
@@ -22,7 +22,7 @@ from .helpers_for_tests import create_system_configuration
 from .helpers_for_tests import create_positions
 from particlesim.utils.conversion import prefactor
 from .api import SystemConfiguration
-from .ewald_summation import EwaldSummation
+from .ewald_summation import EwaldSummation, SPMEEwaldSummation
 from .shortrange import Shortrange
 from .total_potential import TotalPotential
 
@@ -301,6 +301,25 @@ def shortrange_with_different_neighbouring():
     np.testing.assert_allclose(actual=potential_neigh_true, desired=potential_neigh_false, rtol=0.01)
 
 
+def test_shortrange_neighbouring_periodic():
+    """
+    With neighbour lists the shortrange energy of a dense periodic system has to equal the all-pairs result.
+    """
+    n = 100
+    system_conf = create_system_configuration(n, box_size=12, r_cutoff=3., k_cutoff=3.)
+    positions = create_positions(n, box_size=12)
+    potential_neigh_false = system_conf._total_potential.shortrange_energy(positions)
+    system_conf.neighbouring = True
+    potential_neigh_true = system_conf._total_potential.shortrange_energy(positions)
+    np.testing.assert_allclose(actual=potential_neigh_true, desired=potential_neigh_false, rtol=1e-10)
+    system_conf.neighbouring_method = "verlet"
+    potential_verlet = system_conf._total_potential.shortrange_energy(positions)
+    np.testing.assert_allclose(actual=potential_verlet, desired=potential_neigh_false, rtol=1e-10)
+    system_conf.neighbouring_method = "kdtree"
+    potential_kdtree = system_conf._total_potential.shortrange_energy(positions)
+    np.testing.assert_allclose(actual=potential_kdtree, desired=potential_neigh_false, rtol=1e-10)
+
+
 def coulomb_random():
     """
     Test the shortrange coulomb energy with a number of particles distributed in a 3x3x3 box inside of a 120x120x120
@@ -327,3 +346,225 @@ def lennard_jones_random():
     test_lennard_jones = test_potential[1]
 
     np.testing.assert_allclose(actual=sim_lennard_jones, desired=test_lennard_jones, rtol=0.01)
+
+
+def test_delta_potential():
+    """
+    Compare the energy difference of a single particle move to two full calculations.
+    """
+    n = 20
+    system_conf = create_system_configuration(n, box_size=10)
+    xyz = system_conf.xyz
+    new_xyz = xyz.copy()
+    new_xyz[3] = create_positions(1, box_size=10)[0]
+
+    system_conf.init_incremental(xyz)
+    delta = system_conf.delta_potential(xyz, 3, new_xyz[3], lennard_jones=True, coulomb=True)
+    system_conf.commit(coulomb=True)
+
+    reference = system_conf.potential(new_xyz, lennard_jones=True, coulomb=True) - \
+                system_conf.potential(xyz, lennard_jones=True, coulomb=True)
+    np.testing.assert_allclose(delta, reference, rtol=1e-8, atol=1e-8)
+
+
+def test_ewald_delta_energy_several_particles():
+    """
+    Move several particles at once and compare the incremental longrange energy to full calculations.
+    Rejected moves must not change the stored structure factor.
+    """
+    n = 30
+    system_conf = create_system_configuration(n, box_size=10)
+    ewald_summation = EwaldSummation(system_conf, sigma=1., k_cutoff=4)
+    xyz = system_conf.xyz
+    indices = np.array([1, 7, 12])
+    new_xyz = xyz.copy()
+    new_xyz[indices] = create_positions(len(indices), box_size=10)
+
+    ewald_summation.init_structure_factor(xyz)
+    ewald_summation.delta_energy(indices, xyz[indices], create_positions(len(indices), box_size=10))
+    ewald_summation.rollback()
+    delta = ewald_summation.delta_energy(indices, xyz[indices], new_xyz[indices])
+    ewald_summation.commit()
+
+    reference = ewald_summation.longrange_energy(new_xyz) - ewald_summation.longrange_energy(xyz)
+    np.testing.assert_allclose(delta, reference, rtol=1e-8, atol=1e-10)
+
+    # The stored structure factor is now the one of the new configuration
+    ewald_summation.delta_energy(0, new_xyz[0], xyz[0])
+    np.testing.assert_allclose(ewald_summation._structure_factor,
+                               ewald_summation._calc_structure_factor(new_xyz, system_conf.charges))
+
+
+def test_ewald_constants_follow_setters():
+    """
+    Cached k-space constants have to be recalculated if sigma or k_cutoff are changed.
+    """
+    n = 20
+    system_conf = create_system_configuration(n, box_size=10)
+    ewald_summation = EwaldSummation(system_conf, sigma=1., k_cutoff=2)
+    ewald_summation.sigma = 0.7
+    ewald_summation.k_cutoff = 4
+    reference = EwaldSummation(system_conf, sigma=0.7, k_cutoff=4)
+    np.testing.assert_allclose(ewald_summation.longrange_energy(system_conf.xyz),
+                               reference.longrange_energy(system_conf.xyz))
+
+
+def test_ewald_half_space():
+    """
+    The half space of k-vectors has to give the same longrange energy as the full sphere.
+    """
+    n = 20
+    system_conf = create_system_configuration(n, box_size=10)
+    half = EwaldSummation(system_conf, sigma=1., k_cutoff=5)
+    full = EwaldSummation(system_conf, sigma=1., k_cutoff=5, half_space=False)
+    assert 2 * len(half.k_vectors) == len(full.k_vectors)
+    np.testing.assert_allclose(half.longrange_energy(system_conf.xyz), full.longrange_energy(system_conf.xyz),
+                               rtol=1e-10)
+
+
+def test_ewald_phase_tables():
+    """
+    The structure factor from phase tables has to match the direct evaluation.
+    """
+    n = 20
+    system_conf = create_system_configuration(n, box_size=10)
+    for half_space in [True, False]:
+        tables = EwaldSummation(system_conf, sigma=1., k_cutoff=5, half_space=half_space, phase_tables=True)
+        direct = EwaldSummation(system_conf, sigma=1., k_cutoff=5, half_space=half_space, phase_tables=False)
+        np.testing.assert_allclose(tables._calc_structure_factor(system_conf.xyz, system_conf.charges),
+                                   direct._calc_structure_factor(system_conf.xyz, system_conf.charges),
+                                   rtol=1e-10, atol=1e-10)
+        np.testing.assert_allclose(tables.longrange_energy(system_conf.xyz), direct.longrange_energy(system_conf.xyz),
+                                   rtol=1e-10)
+    assert system_conf._total_potential.longrange.phase_tables
+    system_conf.phase_tables = False
+    assert not system_conf._total_potential.longrange.phase_tables
+
+
+
+def test_batch_matches_single_configurations():
+    """
+    The batched longrange and shortrange energies have to match the energies of the single
+    configurations, also for positions outside the box and several threads.
+    """
+    system_conf, test_potential = create_test_system()
+    box_size = system_conf.box_size
+    positions = np.array([create_positions(len(system_conf.xyz), box_size=box_size) for i in range(5)])
+    positions[1] += box_size
+    positions[2] -= 0.5 * box_size
+    for half_space in [True, False]:
+        ewald_summation = EwaldSummation(system_conf, sigma=1., k_cutoff=5, half_space=half_space)
+        np.testing.assert_allclose(ewald_summation.longrange_energy_batch(positions),
+                                   [ewald_summation.longrange_energy(frame) for frame in positions], rtol=1e-10)
+    shortrange = Shortrange(system_conf, sigma_c=1., r_cutoff=8.)
+    for num_threads in [1, 3]:
+        shortrange.num_threads = num_threads
+        for lj, coulomb in [(True, True), (True, False), (False, True)]:
+            np.testing.assert_allclose(shortrange.shortrange_batch(positions, lj=lj, coulomb=coulomb),
+                                       [shortrange.shortrange(frame, lj=lj, coulomb=coulomb) for frame in positions],
+                                       rtol=1e-10)
+
+def test_spme_matches_ewald():
+    """
+    Compare the Smooth Particle Mesh Ewald energy to the classic Ewald summation.
+    """
+    n = 50
+    system_conf = create_system_configuration(n, box_size=10)
+    sigma = 1.
+    ewald_summation = EwaldSummation(system_conf, sigma=sigma, k_cutoff=12)
+    spme = SPMEEwaldSummation(system_conf, sigma=sigma)
+    np.testing.assert_allclose(spme.longrange_energy(system_conf.xyz), ewald_summation.longrange_energy(system_conf.xyz),
+                               rtol=1e-4)
+
+
+def test_spme_selected_by_system_configuration():
+    n = 20
+    positions = create_positions(n, box_size=10)
+    charges = np.append(np.ones(n // 2), -np.ones(n // 2))
+    system_conf = SystemConfiguration(positions, charges=charges, box_size=10, longrange_method="spme")
+    assert isinstance(system_conf._total_potential.longrange, SPMEEwaldSummation)
+    assert isinstance(system_conf.potential(positions, lennard_jones=True, coulomb=True), float)
+
+
+def test_shortrange_kernels_agree():
+    """
+    The compiled pair kernel has to give the same shortrange energy as the numpy kernel.
+    """
+    for i in range(5):
+        system_conf, test_potential = create_test_system()
+        shortrange = Shortrange(system_conf, sigma_c=1., r_cutoff=8.)
+        positions = create_positions(len(system_conf.xyz), box_size=system_conf.box_size)
+        for lj, coulomb in [(True, True), (True, False), (False, True)]:
+            shortrange.kernel = "cython"
+            compiled = shortrange.shortrange(positions, lj=lj, coulomb=coulomb)
+            shortrange.kernel = "numpy"
+            vectorized = shortrange.shortrange(positions, lj=lj, coulomb=coulomb)
+            np.testing.assert_allclose(compiled, vectorized, rtol=1e-10)
+
+
+def test_shortrange_kernels_multithreaded():
+    """
+    The multithreaded kernels have to give the same shortrange energy as the serial ones.
+    """
+    system_conf, test_potential = create_test_system()
+    shortrange = Shortrange(system_conf, sigma_c=1., r_cutoff=8.)
+    positions = create_positions(len(system_conf.xyz), box_size=system_conf.box_size)
+    for kernel in ["cython", "numpy"]:
+        shortrange.kernel = kernel
+        shortrange.num_threads = 1
+        serial = shortrange.shortrange(positions)
+        shortrange.num_threads = 4
+        parallel = shortrange.shortrange(positions)
+        np.testing.assert_allclose(parallel, serial, rtol=1e-10)
+
+
+def test_particle_energies():
+    """
+    Half of the sum of all particle energies is the shortrange energy.
+    """
+    n = 100
+    system_conf = create_system_configuration(n, box_size=12, r_cutoff=3., k_cutoff=3.)
+    positions = create_positions(n, box_size=12)
+    shortrange = system_conf._total_potential.shortrange
+    for neighbouring in [False, True]:
+        system_conf.neighbouring = neighbouring
+        energies = shortrange.particle_energies(positions)
+        np.testing.assert_allclose(0.5 * np.sum(energies), shortrange.shortrange(positions), rtol=1e-10)
+
+
+def test_shortrange_lennard_jones_types():
+    """
+    All shortrange paths have to look up the mixed Lennard-Jones parameters of several types correctly.
+    """
+    n, box_size = 60, 15.
+    positions = create_positions(n, box_size=box_size)
+    sigmas = np.random.choice([1., 1.5, 2.], n)
+    epsilons = np.random.choice([0.5, 1.], n)
+    system_conf = SystemConfiguration(xyz=positions, sigmas=sigmas, epsilons=epsilons, box_size=box_size)
+
+    distances = np.linalg.norm(box_size / 2 - (positions[:, np.newaxis] - positions + box_size / 2) % box_size, axis=2)
+    i, j = np.triu_indices(n, 1)
+    mask = distances[i, j] < system_conf.lj_cutoff_matrix[i, j]
+    q = (system_conf.lj_sigma_matrix[i, j][mask] / distances[i, j][mask]) ** 6
+    reference = np.sum(4 * system_conf.lj_epsilon_matrix[i, j][mask] * q * (q - 1))
+
+    shortrange = Shortrange(system_conf, sigma_c=1., r_cutoff=3.)
+    for kernel in ["cython", "numpy"]:
+        shortrange.kernel = kernel
+        np.testing.assert_allclose(shortrange.shortrange(positions, coulomb=False), reference, rtol=1e-10)
+    shortrange.neighbouring = True
+    np.testing.assert_allclose(shortrange.shortrange(positions, coulomb=False), reference, rtol=1e-10)
+
+
+def test_shortrange_numpy_kernel_blocks():
+    """
+    The streamed numpy kernel must not depend on the block size.
+    """
+    system_conf, test_potential = create_test_system()
+    shortrange = Shortrange(system_conf, sigma_c=1., r_cutoff=8.)
+    shortrange.kernel = "numpy"
+    positions = create_positions(len(system_conf.xyz), box_size=system_conf.box_size)
+    reference = shortrange.shortrange(positions)
+    for block_size in [1, 3, 7, len(positions)]:
+        shortrange.block_size = block_size
+        np.testing.assert_allclose(shortrange.shortrange(positions), reference, rtol=1e-10)
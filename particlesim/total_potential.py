@@ -15,7 +15,7 @@
 #   You should have received a copy of the GNU General Public License
 #
 
-from particlesim.ewald_summation import EwaldSummation
+from particlesim.ewald_summation import EwaldSummation, SPMEEwaldSummation
 from particlesim.shortrange import Shortrange
 import numpy as np
 import time
@@ -100,7 +100,11 @@ class TotalPotential(object):
 
         """
         # Create instance for long range coulomb energy
-        self.longrange = EwaldSummation(system_configuration, sigma_c, k_cutoff)
+        if system_configuration.longrange_method == "spme":
+            self.longrange = SPMEEwaldSummation(system_configuration, sigma_c, k_cutoff)
+        else:
+            self.longrange = EwaldSummation(system_configuration, sigma_c, k_cutoff,
+                                            phase_tables=system_configuration.phase_tables)
         # Create instance for calculation of shortrange energy
         self.shortrange = Shortrange(system_configuration, sigma_c, r_cutoff)
 
@@ -117,6 +121,115 @@ class TotalPotential(object):
         pot += self.shortrange_energy(xyz_trial, lennard_jones, coulomb)
         return pot
 
+    def potential_batch(self, xyz_stack, lennard_jones=True, coulomb=True, chunk_size=16):
+        r"""
+        Calculates the total potential of a stack of configurations.
+
+        Parameters
+        ----------
+        xyz_stack : numpy.ndarray(shape=(b, n, 3))
+            Positions of n particles for b configurations.
+        lennard_jones : bool
+            If true calculate lennard jones potential.
+        coulomb : bool
+            If true calculate coulomb potential.
+        chunk_size : int
+            Number of configurations evaluated at once. The memory of the batched
+            Ewald summation grows linearly with it.
+
+        Returns
+        -------
+        numpy.ndarray(shape=(b,))
+            Total potential of every configuration.
+        """
+        potentials = np.zeros(len(xyz_stack))
+        for start in range(0, len(xyz_stack), chunk_size):
+            chunk = np.asarray(xyz_stack[start:start + chunk_size], dtype=float)
+            if coulomb:
+                potentials[start:start + len(chunk)] += self.longrange.longrange_energy_batch(chunk)
+            potentials[start:start + len(chunk)] += self.shortrange.shortrange_batch(chunk, lj=lennard_jones,
+                                                                                     coulomb=coulomb)
+        return potentials
+
+    def init_incremental(self, positions):
+        r"""
+        Stores the state of an accepted configuration, which is needed by delta_potential.
+
+        Parameters
+        ----------
+        positions : numpy.ndarray(shape=(n, 3))
+            Accepted configuration.
+        """
+        self.longrange.init_structure_factor(positions)
+        self.shortrange.init_incremental(positions)
+
+    def delta_potential(self, positions, index, new_position, lennard_jones=True, coulomb=True):
+        r"""
+        Calculates the change of the total potential if a single particle is moved.
+
+        Parameters
+        ----------
+        positions : numpy.ndarray(shape=(n, 3))
+            Accepted configuration, as passed to init_incremental.
+        index : int
+            Index of the moved particle.
+        new_position : numpy.ndarray(shape=(3,))
+            Trial position of the moved particle.
+        lennard_jones : bool
+            If true calculate lennard jones potential.
+        coulomb : bool
+            If true calculate coulomb potential.
+
+        Returns
+        -------
+        float
+            Difference of the total potential between trial and accepted configuration.
+        """
+        delta = 0.
+        if coulomb:
+            delta += self.longrange.delta_energy(index, positions[index], new_position)
+        delta += self.shortrange.shortrange_delta(positions, index, new_position, lj=lennard_jones, coulomb=coulomb)
+        return delta
+
+    def commit(self, coulomb=True):
+        r"""
+        Accepts the trial move of the last delta_potential call.
+        """
+        if coulomb:
+            self.longrange.commit()
+        self.shortrange.commit()
+
+    def rollback(self, coulomb=True):
+        r"""
+        Rejects the trial move of the last delta_potential call.
+        """
+        if coulomb:
+            self.longrange.rollback()
+        self.shortrange.rollback()
+
+    def get_incremental_state(self):
+        r"""
+        Returns the state of the accepted configuration of single particle moves. Several
+        configurations can be sampled alternately by switching between their states with
+        set_incremental_state, instead of calling init_incremental again.
+
+        Returns
+        -------
+        tuple
+            State of the longrange and the shortrange potential.
+        """
+        return self.longrange.get_incremental_state(), self.shortrange.get_incremental_state()
+
+    def set_incremental_state(self, state):
+        r"""
+        Parameters
+        ----------
+        state : tuple
+            State returned by get_incremental_state.
+        """
+        longrange_state, shortrange_state = state
+        self.longrange.set_incremental_state(longrange_state)
+        self.shortrange.set_incremental_state(shortrange_state)
 
     def _estimate_parameters(self):
         '''
@@ -0,0 +1,96 @@
+#   particlesim
+#   Copyright (C) 2017 Mark Niehues, Stefaan Hessmann, Jaap Pedersen,
+#                       Simon Treu, Hanna Wulkow, Thomas Hadler
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#
+
+import numpy as np
+
+
+class RandomBlocks(object):
+    r"""
+    Uniform random numbers in [0, 1) from a numpy Generator with the SFC64 bit generator,
+    drawn in blocks so that the many small requests of a Monte Carlo run do not pay the
+    call overhead of the Generator each time.
+
+    Parameters
+    ----------
+    seed : None, int or numpy.random.SeedSequence
+        Seed of the stream. Use SeedSequence.spawn for independent streams.
+    block_size : int, optional, default=65536
+        Number of random numbers drawn at once.
+    """
+    def __init__(self, seed=None, block_size=65536):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.block_size = block_size
+        self._generator = np.random.Generator(np.random.SFC64(seed))
+        self._block = np.zeros(0)
+        self._position = 0
+        self._block_state = self._generator.bit_generator.state
+
+    def _refill(self, n):
+        # Remember the state before the block, a block can be regenerated from it
+        self._block_state = self._generator.bit_generator.state
+        self._block = self._generator.random(max(self.block_size, n))
+        self._position = 0
+
+    def random(self, size=None):
+        r"""
+        Parameters
+        ----------
+        size : int or tuple of int, optional, default=None
+            Shape of the returned array; a float if None.
+
+        Returns
+        -------
+        float or numpy.ndarray of float
+        """
+        n = 1 if size is None else int(np.prod(size))
+        if self._position + n > len(self._block):
+            self._refill(n)
+        values = self._block[self._position:self._position + n]
+        self._position += n
+        if size is None:
+            return float(values[0])
+        return values.reshape(size)
+
+    def get_state(self):
+        r"""
+        Returns
+        -------
+        dict
+            State of the stream, contains only lists and numbers, e.g. for json.
+        """
+        block_state = dict(self._block_state)
+        block_state['state'] = {key: np.asarray(value).tolist() for key, value in block_state['state'].items()}
+        return {'block_state': block_state, 'block_length': len(self._block), 'position': self._position,
+                'block_size': self.block_size}
+
+    def set_state(self, state):
+        r"""
+        Parameters
+        ----------
+        state : dict
+            State returned by get_state.
+        """
+        block_state = dict(state['block_state'])
+        block_state['state'] = {key: np.asarray(value, dtype=np.uint64)
+                                for key, value in block_state['state'].items()}
+        self._generator.bit_generator.state = block_state
+        self.block_size = state['block_size']
+        self._block_state = self._generator.bit_generator.state
+        self._block = self._generator.random(state['block_length'])
+        self._position = state['position']
@@ -0,0 +1,234 @@
+#   particlesim
+#   Copyright (C) 2017 Mark Niehues, Stefaan Hessmann, Jaap Pedersen,
+#                       Simon Treu, Hanna Wulkow, Thomas Hadler
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#
+
+import os
+import numpy as np
+
+
+class TrajectorySink(object):
+    r"""
+    Receives the frames of a sampling run. The sampler calls open once with the number of
+    frames that will be stored, append for every stored frame and close at the end; the
+    return value of close is returned by the sampler. Before a checkpoint is written the
+    sampler calls flush, a resumed run opens the sink with the number of frames stored
+    up to the checkpoint.
+    """
+    def open(self, n_frames, n_particles, start=0):
+        r"""
+        Parameters
+        ----------
+        n_frames : int
+            Number of frames of the whole run.
+        n_particles : int
+            Number of particles of every frame.
+        start : int, optional, default=0
+            Number of frames stored before, by the run that wrote the checkpoint.
+            Sinks writing to a file keep these frames and drop any frames after them.
+        """
+        pass
+
+    def append(self, xyz, pot):
+        r"""
+        Parameters
+        ----------
+        xyz : numpy.ndarray(shape=(n, 3))
+            Positions of the frame.
+        pot : float
+            Potential of the frame.
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        r"""
+        Writes all appended frames, so they survive a crash of the run.
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class MemorySink(TrajectorySink):
+    r"""
+    Stores the trajectory in preallocated arrays in memory.
+
+    close returns the arrays (xyz, pot) with shape (n_frames, n, 3) and (n_frames,). A resumed
+    run only stores the frames after the checkpoint.
+    """
+    def open(self, n_frames, n_particles, start=0):
+        self.xyz = np.zeros((n_frames - start, n_particles, 3))
+        self.pot = np.zeros(n_frames - start)
+        self._frame = 0
+
+    def append(self, xyz, pot):
+        self.xyz[self._frame] = xyz
+        self.pot[self._frame] = pot
+        self._frame += 1
+
+    def close(self):
+        return self.xyz[:self._frame], self.pot[:self._frame]
+
+
+class MemmapSink(TrajectorySink):
+    r"""
+    Stores the trajectory in preallocated memory-mapped .npy files, so only the pages
+    that are written are kept in memory.
+
+    close flushes the files and returns the memory-mapped arrays (xyz, pot).
+
+    Parameters
+    ----------
+    xyz_path : str
+        Path of the .npy file for the positions, shape=(n_frames, n, 3).
+    pot_path : str, optional, default=None
+        Path of the .npy file for the potentials. Default: xyz_path with the suffix "_pot".
+    """
+    def __init__(self, xyz_path, pot_path=None):
+        self.xyz_path = xyz_path
+        if pot_path is None:
+            root, ext = os.path.splitext(xyz_path)
+            pot_path = root + '_pot' + (ext or '.npy')
+        self.pot_path = pot_path
+
+    def open(self, n_frames, n_particles, start=0):
+        if start:
+            self.xyz = np.lib.format.open_memmap(self.xyz_path, mode='r+')
+            self.pot = np.lib.format.open_memmap(self.pot_path, mode='r+')
+            if self.xyz.shape != (n_frames, n_particles, 3) or self.pot.shape != (n_frames,):
+                raise ValueError('the files of the sink do not belong to the resumed run')
+        else:
+            self.xyz = np.lib.format.open_memmap(self.xyz_path, mode='w+', dtype=np.float64,
+                                                 shape=(n_frames, n_particles, 3))
+            self.pot = np.lib.format.open_memmap(self.pot_path, mode='w+', dtype=np.float64, shape=(n_frames,))
+        self._frame = start
+
+    def append(self, xyz, pot):
+        self.xyz[self._frame] = xyz
+        self.pot[self._frame] = pot
+        self._frame += 1
+
+    def flush(self):
+        self.xyz.flush()
+        self.pot.flush()
+
+    def close(self):
+        self.flush()
+        return self.xyz[:self._frame], self.pot[:self._frame]
+
+
+class ChunkedFileSink(TrajectorySink):
+    r"""
+    Appends the trajectory to a binary file in chunks of frames. Every frame is stored as
+    one record of 1 + 3n float64 values: the potential followed by the positions. All
+    complete chunks survive a crash of the run; read the file with load_chunked_trajectory.
+
+    close writes the last chunk and returns the memory-mapped trajectory (xyz, pot).
+
+    Parameters
+    ----------
+    path : str
+        Path of the binary file; an existing file is overwritten, a resumed run appends to it.
+    chunk_size : int, optional, default=1000
+        Number of frames buffered before they are written.
+    """
+    def __init__(self, path, chunk_size=1000):
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError('chunk_size must be a positive integer')
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def open(self, n_frames, n_particles, start=0):
+        self.n_particles = n_particles
+        self._buffer = np.zeros((self.chunk_size, 1 + 3 * n_particles))
+        self._buffered = 0
+        if start:
+            record_bytes = 8 * (1 + 3 * n_particles)
+            if os.path.getsize(self.path) < start * record_bytes:
+                raise ValueError('the file of the sink does not belong to the resumed run')
+            # Frames written after the checkpoint are written again by the resumed run
+            self._file = open(self.path, 'r+b')
+            self._file.truncate(start * record_bytes)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(self.path, 'wb')
+
+    def append(self, xyz, pot):
+        self._buffer[self._buffered, 0] = pot
+        self._buffer[self._buffered, 1:] = np.ravel(xyz)
+        self._buffered += 1
+        if self._buffered == self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        self._file.write(self._buffer[:self._buffered].tobytes())
+        self._file.flush()
+        self._buffered = 0
+
+    def flush(self):
+        self._flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._flush()
+        self._file.close()
+        return load_chunked_trajectory(self.path, self.n_particles)
+
+
+class CallbackSink(TrajectorySink):
+    r"""
+    Passes every frame to a function instead of storing it, e.g. to compute observables
+    on the fly.
+
+    close returns None.
+
+    Parameters
+    ----------
+    callback : callable
+        Called as callback(xyz, pot) for every frame. xyz may be reused by the sampler,
+        copy it if it is kept.
+    """
+    def __init__(self, callback):
+        self.callback = callback
+
+    def append(self, xyz, pot):
+        self.callback(xyz, pot)
+
+
+def load_chunked_trajectory(path, n_particles):
+    r"""
+    Reads a trajectory written by ChunkedFileSink without loading it into memory.
+
+    Parameters
+    ----------
+    path : str
+        Path of the binary file.
+    n_particles : int
+        Number of particles of every frame.
+
+    Returns
+    -------
+    numpy.ndarray(shape=(n_frames, n, 3))
+        Memory-mapped positions.
+    numpy.ndarray(shape=(n_frames,))
+        Memory-mapped potentials.
+    """
+    record = 1 + 3 * n_particles
+    n_frames = os.path.getsize(path) // (8 * record)
+    if n_frames == 0:
+        return np.zeros((0, n_particles, 3)), np.zeros(0)
+    records = np.memmap(path, dtype=np.float64, mode='r', shape=(n_frames, record))
+    return records[:, 1:].reshape(n_frames, n_particles, 3), records[:, 0]
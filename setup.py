@@ -20,6 +20,9 @@ import versioneer
 import sys
 from setuptools import Extension
 import os
+import shutil
+import tempfile
+import warnings
 
 class lazy_cythonize(list):
     """evaluates extension list lazyly.
@@ -34,14 +37,42 @@ class lazy_cythonize(list):
     def __getitem__(self, ii): return self.c_list()[ii]
     def __len__(self): return len(self.c_list())
 
+def openmp_flags():
+    """returns the compile and link flags for OpenMP, or empty lists if the compiler
+    does not support it (e.g. Apple clang); the kernels then run serially."""
+    from distutils.ccompiler import new_compiler
+    from distutils.sysconfig import customize_compiler
+    from distutils.errors import CompileError, LinkError
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    if compiler.compiler_type == 'msvc':
+        compile_flags, link_flags = ['/openmp'], []
+    else:
+        compile_flags, link_flags = ['-fopenmp'], ['-fopenmp']
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, 'test_openmp.c')
+        with open(source, 'w') as f:
+            f.write('#include <omp.h>\nint main(void) { return omp_get_max_threads() > 0 ? 0 : 1; }\n')
+        objects = compiler.compile([source], output_dir=tmpdir, extra_postargs=compile_flags)
+        compiler.link_executable(objects, os.path.join(tmpdir, 'test_openmp'), extra_postargs=link_flags)
+    except (CompileError, LinkError):
+        warnings.warn('the compiler does not support OpenMP, the extension is built without threads')
+        return [], []
+    finally:
+        shutil.rmtree(tmpdir)
+    return compile_flags, link_flags
+
 def extensions():
     from numpy import get_include
     from Cython.Build import cythonize
+    compile_flags, link_flags = openmp_flags()
     ext_fast_sor = Extension(
         "*",
         sources=["particlesim/*.pyx"],
         include_dirs=[get_include()],
-        extra_compile_args=["-O3", "-std=c99"])
+        extra_compile_args=["-O3", "-std=c99"] + compile_flags,
+        extra_link_args=link_flags)
     exts = [ext_fast_sor]
     return cythonize(exts)
 
@@ -107,10 +138,10 @@ setup(
     license='GPLv3+',
     packages=['particlesim', 'particlesim.utils', 'particlesim.lib'],
         setup_requires=[
-        'numpy>=1.7.0',
+        'numpy>=1.17',
         'setuptools>=0.6',
         'scipy>=0.6'],
     package_dir = {'particlesim': 'particlesim'},
-    install_requires=['numpy>=1.7.0','cython>=0.22'],
+    install_requires=['numpy>=1.17','cython>=0.22','scipy>=1.0'],
     tests_require=['pytest']
     )